@@ -1,3 +1,4 @@
+import pytest
 import sys
 import os
 
@@ -32,3 +33,9 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def sync_thumbnails(settings):
+    # Фоновый пул пишет миниатюры во временный MEDIA_ROOT уже после теста
+    settings.THUMBNAIL_ASYNC = False
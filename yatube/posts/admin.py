@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Post, Group, Comment, Follow
+from . import search
+from .models import Post, Group, Comment, Follow, Tag, UserStats
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -8,6 +10,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по индексу posts.search вместо LIKE по всей таблице
+        if not search_term:
+            return queryset, False
+        post_ids = search.get_backend().search(
+            search_term, limit=settings.POSTS_SEARCH_MAX_RESULTS)
+        return queryset.filter(pk__in=post_ids), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("title", "slug", "description")
@@ -30,7 +40,21 @@ class FollowAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ("user", "followers", "following", "posts", "comments")
+    search_fields = ("user__username",)
+    empty_value_display = "-пусто-"
+
+
+class TagAdmin(admin.ModelAdmin):
+    list_display = ("name",)
+    search_fields = ("name",)
+    empty_value_display = "-пусто-"
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(UserStats, UserStatsAdmin)
+admin.site.register(Tag, TagAdmin)
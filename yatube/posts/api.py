@@ -0,0 +1,157 @@
+import json
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST, require_safe
+
+from . import caching, conditional, follows, markup
+from .feeds import feed_queryset
+from .models import Comment, Group, Post, User
+from .paginators import paginate, paginate_comments, paginate_follow
+
+CONTENT_TYPE = 'application/json; charset=utf-8'
+FOLLOW_ACTIONS = ('follow', 'unfollow')
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _error(status, detail):
+    return HttpResponse(_dumps({'detail': detail}), status=status,
+                        content_type=CONTENT_TYPE)
+
+
+def _respond(request, names, items, build, dated=True):
+    """JSON из build() или 304, если у клиента актуальная копия."""
+    return conditional.respond(
+        request, names, items,
+        lambda versions: HttpResponse(_dumps(build()),
+                                      content_type=CONTENT_TYPE),
+        dated=dated)
+
+
+def _link(request, cursor):
+    return cursor and f'{request.path}?cursor={cursor}'
+
+
+def serialize_post(post):
+    return {
+        'id': post.pk,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'text': post.text,
+        'html': markup.body_html(post),
+        'pub_date': post.pub_date.isoformat(),
+        'image': post.image.url if post.image else None,
+        'comment_count': getattr(post, 'comment_count', None),
+        'url': reverse('posts:post',
+                       args=[post.author.username, post.pk]),
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'author': comment.author.username,
+        'html': markup.body_html(comment),
+        'created': comment.created.isoformat(),
+    }
+
+
+def _feed(request, feed, posts, get_page=paginate):
+    page = get_page(request, posts)
+    posts = page.object_list
+    paginator = page.paginator
+    if feed is None:
+        names = [caching.post_card(post.pk) for post in posts]
+    else:
+        names = caching.feed_names(feed, posts)
+    return _respond(request, names, posts, lambda: {
+        'results': [serialize_post(post) for post in posts],
+        'next': _link(request, paginator.next_cursor),
+        'previous': _link(request, paginator.previous_cursor),
+    }, dated=feed is not None)
+
+
+@require_safe
+def index(request):
+    return _feed(request, caching.INDEX_FEED, feed_queryset())
+
+
+@require_safe
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).only('pk').first()
+    if group is None:
+        return _error(404, 'Группа не найдена')
+    return _feed(request, caching.group_feed(group.pk),
+                 feed_queryset(group.posts.all()))
+
+
+@require_safe
+def profile(request, username):
+    author = User.objects.filter(username=username).only('pk').first()
+    if author is None:
+        return _error(404, 'Пользователь не найден')
+    return _feed(request, caching.profile_feed(author.pk),
+                 feed_queryset(author.posts.all()))
+
+
+@require_safe
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return _error(401, 'Нужна авторизация')
+    # У ленты подписок нет своей версии: её состав задают id постов
+    # в ETag, а Last-Modified не отдаётся, чтобы не пропустить удаления.
+    return _feed(request, None, feed_queryset(), paginate_follow)
+
+
+@require_POST
+def follow_batch(request):
+    """Подписки и отписки пачкой: {"follow": [...], "unfollow": [...]}."""
+    if not request.user.is_authenticated:
+        return _error(401, 'Нужна авторизация')
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return _error(400, 'Тело запроса должно быть JSON')
+    if not isinstance(data, dict):
+        return _error(400, 'Ожидается объект с ключами follow и unfollow')
+    batches = {action: data.get(action, []) for action in FOLLOW_ACTIONS}
+    for action, usernames in batches.items():
+        if (not isinstance(usernames, list)
+                or not all(isinstance(name, str) for name in usernames)):
+            return _error(400, f'{action}: ожидается список имён')
+    if sum(map(len, batches.values())) > settings.FOLLOW_BATCH_LIMIT:
+        return _error(
+            400, f'Не больше {settings.FOLLOW_BATCH_LIMIT} имён за запрос')
+    return HttpResponse(_dumps({
+        'followed': follows.follow(request.user, batches['follow']),
+        'unfollowed': follows.unfollow(request.user, batches['unfollow']),
+    }), content_type=CONTENT_TYPE)
+
+
+@require_safe
+def post_detail(request, post_id):
+    post = feed_queryset().filter(pk=post_id).first()
+    if post is None:
+        return _error(404, 'Пост не найден')
+    return _respond(request, [caching.post_card(post.pk)], [post],
+                    lambda: serialize_post(post))
+
+
+@require_safe
+def post_comments(request, post_id):
+    post = Post.objects.filter(pk=post_id).only('pk').first()
+    if post is None:
+        return _error(404, 'Пост не найден')
+    comments = paginate_comments(
+        request, Comment.objects.filter(post=post))
+    paginator = comments.paginator
+    return _respond(
+        request, [caching.post_card(post_id)], comments.object_list,
+        lambda: {
+            'results': [serialize_comment(comment) for comment in comments],
+            'next': _link(request, paginator.next_cursor),
+        })
@@ -0,0 +1,190 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Group
+
+INDEX_FEED = 'index'
+HOT_FEED = 'hot'
+# Теги полностраничного кеша анонимных страниц
+INDEX_PAGES = 'pages:index'
+HOT_PAGES = 'pages:hot'
+
+
+def group_feed(group_id):
+    return f'group:{group_id}'
+
+
+def profile_feed(author_id):
+    return f'profile:{author_id}'
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def _modified_key(name):
+    return f'modified:{name}'
+
+
+def _fresh_version():
+    # Версия от времени, а не с нуля: после вытеснения ключа версии
+    # старые фрагменты не совпадут с новыми.
+    return int(time.time() * 1000)
+
+
+def get_versions(names):
+    keys = {_version_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = {key: _fresh_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, settings.CACHE_VERSION_TTL)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def bump(*names):
+    """Сдвигает версии лент или карточек, делая их фрагменты устаревшими."""
+    for name in names:
+        key = _version_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_version(), settings.CACHE_VERSION_TTL)
+    now = time.time()
+    cache.set_many({_modified_key(name): now for name in names},
+                   settings.CACHE_VERSION_TTL)
+
+
+def get_validators(names):
+    """Версии и время последнего изменения для условных HTTP-запросов.
+
+    Возвращает словарь версий, как get_versions(), и наибольшее время
+    изменения в секундах. Всё читается из кеша одним запросом; если
+    время изменения вытеснено, изменением считается текущий момент.
+    """
+    names = list(names)
+    keys = {_version_key(name): name for name in names}
+    keys.update({_modified_key(name): name for name in names})
+    found = cache.get_many(keys)
+    now = time.time()
+    missing = {}
+    versions = {}
+    last_modified = 0
+    for name in names:
+        version_key, modified_key = _version_key(name), _modified_key(name)
+        if version_key not in found:
+            missing[version_key] = found[version_key] = _fresh_version()
+        if modified_key not in found:
+            missing[modified_key] = found[modified_key] = now
+        versions[name] = found[version_key]
+        last_modified = max(last_modified, found[modified_key])
+    if missing:
+        cache.set_many(missing, settings.CACHE_VERSION_TTL)
+    return versions, last_modified
+
+
+def post_card(post_id):
+    return f'post:{post_id}'
+
+
+def bump_post_feeds(post):
+    """Пост появился в лентах или пропал из них."""
+    feeds = [INDEX_FEED, HOT_FEED, profile_feed(post.author_id)]
+    if post.group_id:
+        feeds.append(group_feed(post.group_id))
+    bump(*feeds)
+
+
+def prepare_cards(posts, user, versions=None):
+    """Проставляет постам ключи фрагментов карточек.
+
+    Ключ карточки зависит от версии поста и от того, автор ли зритель:
+    у автора в карточке есть кнопка «Редактировать».
+    """
+    if versions is None:
+        versions = get_versions(post_card(post.pk) for post in posts)
+    for post in posts:
+        is_author = user.is_authenticated and user.pk == post.author_id
+        post.cache_key = (f'{post.pk}.{versions[post_card(post.pk)]}'
+                          f'.{int(is_author)}')
+    return posts
+
+
+def feed_names(feed, posts):
+    return [feed] + [post_card(post.pk) for post in posts]
+
+
+def feed_cache_key(feed, page, user, versions=None):
+    """Ключ фрагмента страницы ленты.
+
+    Складывается из версии ленты (меняется при добавлении и удалении
+    постов), номера страницы и ключей её карточек, поэтому правка поста
+    или новый комментарий инвалидируют только страницы с этим постом.
+    Все версии читаются из кеша одним запросом, если их не передали.
+    """
+    posts = page.object_list
+    if versions is None:
+        versions = get_versions(feed_names(feed, posts))
+    prepare_cards(posts, user, versions)
+    digest = hashlib.md5(
+        '|'.join(post.cache_key for post in posts).encode()).hexdigest()
+    return f'{feed}.{versions[feed]}.{page.number}.{digest}'
+
+
+def group_pages(slug):
+    return f'pages:group:{slug}'
+
+
+def profile_pages(username):
+    return f'pages:profile:{username}'
+
+
+def purge_pages(*tags):
+    """Сбрасывает полностраничный кеш всех страниц с этими тегами."""
+    bump(*tags)
+    count_page_cache('purges', len(tags))
+
+
+def purge_post_pages(post, *group_ids):
+    """Пост появился, изменился или пропал: главная, его группа и автор.
+
+    В group_ids передаются прежние группы поста, если он из них ушёл.
+    """
+    tags = [INDEX_PAGES, HOT_PAGES, profile_pages(post.author.username)]
+    group_ids = {group_id for group_id in (post.group_id, *group_ids)
+                 if group_id}
+    if group_ids:
+        slugs = Group.objects.filter(pk__in=group_ids).values_list(
+            'slug', flat=True)
+        tags += [group_pages(slug) for slug in slugs]
+    purge_pages(*tags)
+
+
+PAGE_CACHE_EVENTS = ('hits', 'misses', 'purges')
+
+
+def count_page_cache(event, delta=1):
+    key = f'page-cache:{event}'
+    if not cache.add(key, delta, None):
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.set(key, delta, None)
+
+
+def page_cache_stats():
+    """Счётчики полностраничного кеша и доля попаданий."""
+    found = cache.get_many(f'page-cache:{event}'
+                           for event in PAGE_CACHE_EVENTS)
+    stats = {event: found.get(f'page-cache:{event}', 0)
+             for event in PAGE_CACHE_EVENTS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0
+    return stats
+
+
+def reset_page_cache_stats():
+    cache.delete_many(f'page-cache:{event}' for event in PAGE_CACHE_EVENTS)
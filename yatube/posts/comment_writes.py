@@ -0,0 +1,239 @@
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+
+from . import caching, hot, markup, stats
+from .models import Comment
+
+logger = logging.getLogger(__name__)
+
+_writer = None
+_writer_lock = threading.Lock()
+# Сигнал остановки для потока записи
+_STOP = object()
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Повторите через {retry_after} с')
+        self.retry_after = retry_after
+
+
+def _rate_key(user_id, window):
+    return f'comment-rate:{user_id}:{window}'
+
+
+def _idempotency_key(user_id, key):
+    # Ключ присылает клиент: хеш годится в ключ кеша при любой длине
+    # и любых символах
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return f'comment-idempotency:{user_id}:{digest}'
+
+
+def check_rate(user_id):
+    """Считает комментарий в окне COMMENT_RATE_PERIOD секунд.
+
+    Счётчик окна живёт в кеше и общий для всех процессов. При
+    превышении COMMENT_RATE_LIMIT бросает RateLimited; 0 — без лимита.
+    """
+    limit = settings.COMMENT_RATE_LIMIT
+    if not limit:
+        return
+    period = settings.COMMENT_RATE_PERIOD
+    now = int(time.time())
+    key = _rate_key(user_id, now // period)
+    if cache.add(key, 1, period):
+        return
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Окно вытеснили между add и incr
+        cache.set(key, 1, period)
+        return
+    # None — кеш недоступен: без счётчика лимит не применяется
+    if count is not None and count > limit:
+        raise RateLimited(period - now % period)
+
+
+def claim(user_id, key):
+    """Занимает ключ идемпотентности; False — это повторная отправка.
+
+    Если кеш недоступен, add() возвращает None, и комментарий
+    сохраняется без проверки повторов.
+    """
+    if not key:
+        return True
+    return cache.add(_idempotency_key(user_id, key), True,
+                     settings.COMMENT_IDEMPOTENCY_TTL) is not False
+
+
+def release(user_id, key):
+    if key:
+        cache.delete(_idempotency_key(user_id, key))
+
+
+def comments_created(comments):
+    """Счётчики, «Популярное» и кеш карточек после новых комментариев."""
+    by_count = defaultdict(list)
+    for author_id, count in Counter(
+            comment.author_id for comment in comments).items():
+        by_count[count].append(author_id)
+    for count, author_ids in by_count.items():
+        stats.bump_many(author_ids, 'comments', count)
+    hot.add_comments(comments)
+    # Пост мог сдвинуться в «Популярном»; полностраничный кеш
+    # анонимов не сбрасывается и доживает свой короткий TTL
+    caching.bump(caching.HOT_FEED, *{
+        caching.post_card(comment.post_id) for comment in comments})
+
+
+def save_batch(comments):
+    """Сохраняет пачку комментариев одной короткой транзакцией.
+
+    Разметка рисуется до транзакции, а bulk_create не шлёт сигналов,
+    поэтому их работа делается здесь же для всей пачки сразу.
+    """
+    for comment in comments:
+        markup.render_into(comment)
+    with transaction.atomic():
+        Comment.objects.bulk_create(comments)
+        comments_created(comments)
+
+
+class CommentWriter:
+    """Очередь комментариев и поток, который пишет их пачками.
+
+    Поток забирает всё, что накопилось в очереди, но не больше
+    batch_size, подождав ещё linger секунд, пока пачка не полна. Так
+    под нагрузкой одна блокировка записи приходится на пачку, а не на
+    каждый комментарий.
+    """
+
+    def __init__(self, batch_size=50, linger=0.005, max_pending=1000):
+        self.batch_size = batch_size
+        self.linger = linger
+        self.queue = queue.Queue(max_pending)
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name='comment-writer')
+        self.thread.start()
+
+    def submit(self, comment):
+        """Future с сохранённым комментарием; queue.Full при переполнении."""
+        future = Future()
+        self.queue.put_nowait((comment, future))
+        return future
+
+    def stop(self):
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def run(self):
+        try:
+            while True:
+                items = self.collect()
+                stopping = _STOP in items
+                self.flush([item for item in items if item is not _STOP])
+                if stopping:
+                    return
+                # Как в конце запроса: соединение закрывается, если
+                # CONN_MAX_AGE истёк или равен нулю
+                close_old_connections()
+        finally:
+            connection.close()
+
+    def collect(self):
+        items = [self.queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(items) < self.batch_size and items[-1] is not _STOP:
+            try:
+                items.append(self.queue.get(
+                    timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return items
+
+    def flush(self, items):
+        if not items:
+            return
+        try:
+            save_batch([comment for comment, _ in items])
+        except Exception:
+            logger.exception('Пачка комментариев не записалась, '
+                             'сохраняем по одному')
+            for comment, future in items:
+                self.save_one(comment, future)
+        else:
+            for comment, future in items:
+                future.set_result(comment)
+
+    def save_one(self, comment, future):
+        # Один плохой комментарий (пост уже удалили) не роняет остальные
+        comment.pk = None
+        try:
+            comment.save()
+        except Exception as error:
+            future.set_exception(error)
+        else:
+            future.set_result(comment)
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = CommentWriter(
+                batch_size=settings.COMMENT_BATCH_SIZE,
+                linger=settings.COMMENT_BATCH_LINGER,
+                max_pending=settings.COMMENT_BATCH_QUEUE)
+    return _writer
+
+
+def stop_writer():
+    """Дописывает очередь и останавливает поток записи."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def write(comment, idempotency_key=None):
+    """Сохраняет новый комментарий с защитой от повторов и флуда.
+
+    Возвращает False для повторной отправки с тем же ключом. При
+    COMMENT_WRITE_MODE = 'batch' комментарий уходит в очередь потока
+    записи, и запрос ждёт, пока его пачка сохранится, поэтому после
+    редиректа автор видит свой комментарий. Если очередь переполнена,
+    комментарий сохраняется сразу, как в режиме 'sync'.
+    """
+    user_id = comment.author_id
+    if not claim(user_id, idempotency_key):
+        return False
+    try:
+        check_rate(user_id)
+        if settings.COMMENT_WRITE_MODE == 'batch':
+            try:
+                future = get_writer().submit(comment)
+            except queue.Full:
+                comment.save()
+            else:
+                try:
+                    future.result(timeout=settings.COMMENT_BATCH_TIMEOUT)
+                except TimeoutError:
+                    # Комментарий останется в очереди и запишется позже
+                    logger.warning('Комментарий ждёт записи дольше %s с',
+                                   settings.COMMENT_BATCH_TIMEOUT)
+        else:
+            comment.save()
+    except Exception:
+        release(user_id, idempotency_key)
+        raise
+    return True
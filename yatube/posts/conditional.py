@@ -0,0 +1,69 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from . import caching
+
+
+def validators(request, names, items, timestamps=(), extra=()):
+    """ETag, Last-Modified и версии кеша для страницы.
+
+    ETag складывается из адреса, версий кеша для names, id элементов
+    страницы и extra; Last-Modified — наибольшее из времени изменения
+    версий и timestamps. Версии читаются из кеша одним запросом.
+    """
+    versions, last_modified = caching.get_validators(names)
+    fingerprint = '|'.join(
+        [request.get_full_path()]
+        + [f'{name}.{versions[name]}' for name in names]
+        + [str(item.pk) for item in items]
+        + [str(value) for value in extra])
+    etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+    last_modified = max([last_modified]
+                        + [moment.timestamp() for moment in timestamps
+                           if moment is not None])
+    return etag, int(last_modified), versions
+
+
+def respond(request, names, items, build, timestamps=(), extra=(),
+            dated=True):
+    """Отвечает 304 или ответом build(versions) с валидаторами.
+
+    build вызывается, только если у клиента нет актуальной копии.
+    Без dated отдаётся только ETag.
+    """
+    etag, last_modified, versions = validators(
+        request, names, items, timestamps, extra)
+    if not dated:
+        last_modified = None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build(versions)
+    response['ETag'] = etag
+    if dated:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def anonymous_page(request, names, items, build, timestamps=(), extra=(),
+                   dated=True):
+    """Условный ответ с публичным Cache-Control для анонимов.
+
+    Страницы авторизованных пользователей зависят от сессии, поэтому
+    рендерятся как обычно и помечаются private.
+    """
+    if request.user.is_authenticated:
+        response = build(None)
+        patch_cache_control(response, private=True)
+        return response
+    response = respond(request, names, items, build, timestamps, extra,
+                       dated)
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.ANONYMOUS_CACHE_MAX_AGE,
+        stale_while_revalidate=settings.ANONYMOUS_CACHE_STALE)
+    return response
@@ -1,8 +1,30 @@
 import datetime as dt
 
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from posts.follows import followed_authors as load_followed_authors
+
 
 def year(request):
     current_year = dt.datetime.today().year
     return {
         'year': current_year
     }
+
+
+def cache_ttl(request):
+    return {
+        'cache_ttl': settings.FEED_CACHE_TTL
+    }
+
+
+def followed_authors(request):
+    """Подписки зрителя для кнопок «Подписаться» в шаблонах.
+
+    Загружаются, только если шаблон к ним обратился.
+    """
+    return {
+        'followed_authors': SimpleLazyObject(
+            lambda: load_followed_authors(request.user))
+    }
@@ -0,0 +1,28 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Post
+
+
+def comment_count_subquery():
+    """Число комментариев поста коррелированным подзапросом.
+
+    В отличие от annotate(Count('comments')) не требует GROUP BY по всей
+    ленте и считается только для строк, попавших в страницу.
+    """
+    comments = (Comment.objects
+                .filter(post=OuterRef('pk'))
+                .order_by()
+                .values('post')
+                .annotate(total=Count('pk'))
+                .values('total'))
+    return Coalesce(Subquery(comments, output_field=IntegerField()), 0)
+
+
+def feed_queryset(queryset=None):
+    """Лента постов со всем, что нужно для post_item.html, одним запросом."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    return (queryset
+            .select_related('author', 'group')
+            .annotate(comment_count=comment_count_subquery()))
@@ -0,0 +1,203 @@
+from array import array
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from .models import Follow
+
+
+def _csr(rows, columns, size):
+    """Сжатые строки: соседи строки r — indices[indptr[r]:indptr[r + 1]].
+
+    Внутри строки соседи идут в порядке рёбер, то есть от старых
+    подписок к новым.
+    """
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    indices = columns[np.argsort(rows, kind='stable')].astype(np.int32)
+    return indptr, indices
+
+
+def _gather(indptr, indices, rows):
+    """Соседи строк rows подряд и, для каждого, его строка."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    ends = np.cumsum(lengths)
+    positions = (np.arange(ends[-1] if len(ends) else 0)
+                 + np.repeat(starts - ends + lengths, lengths))
+    return np.repeat(rows, lengths), indices[positions]
+
+
+def _latest(indptr, indices, limit):
+    """Разреженная матрица из последних limit соседей каждой строки."""
+    size = len(indptr) - 1
+    lengths = np.diff(indptr)
+    rows = np.repeat(np.arange(size), lengths)
+    # Номер соседа с конца строки: у самого нового — 1
+    keep = indptr[rows + 1] - np.arange(len(indices)) <= limit
+    return sparse.csr_matrix(
+        (np.ones(np.count_nonzero(keep)), (rows[keep], indices[keep])),
+        shape=(size, size))
+
+
+def _top_per_row(rows, columns, values, limit):
+    """Не больше limit наибольших значений в каждой строке.
+
+    Результат упорядочен по строкам и убыванию значения; из равных
+    первым идёт меньший столбец.
+    """
+    order = np.lexsort((columns, -values, rows))
+    ranked = rows[order]
+    rank = np.arange(len(order)) - np.searchsorted(ranked, ranked)
+    order = order[rank < limit]
+    return rows[order], columns[order], values[order]
+
+
+class FollowGraph:
+    """Граф подписок в памяти и расчёт рекомендаций по нему.
+
+    Рёбра хранятся дважды, по подписчикам и по авторам, в массивах
+    numpy. У популярных вершин берутся только max_neighbors самых новых
+    соседей, поэтому стоимость расчёта для пользователя не зависит от
+    размера графа. Сам расчёт — произведения разреженных матриц этих
+    выборок для пачки пользователей сразу.
+    """
+
+    def __init__(self, users, authors, max_neighbors=50, similar_authors=20,
+                 co_follow_weight=1.0):
+        users = np.asarray(users, dtype=np.int64)
+        authors = np.asarray(authors, dtype=np.int64)
+        self.size = int(max(users.max(initial=0),
+                            authors.max(initial=0))) + 1
+        self.out_ptr, self.out_ids = _csr(users, authors, self.size)
+        self.in_ptr, self.in_ids = _csr(authors, users, self.size)
+        self.max_neighbors = max_neighbors
+        self.similar_limit = similar_authors
+        self.co_follow_weight = co_follow_weight
+        # Строка — пользователь, в ней его последние подписки
+        self.sampled = _latest(self.out_ptr, self.out_ids, max_neighbors)
+        self._candidates = None
+
+    @property
+    def edges(self):
+        return len(self.out_ids)
+
+    def following(self, user_id):
+        if user_id >= self.size:
+            return self.out_ids[:0]
+        return self.out_ids[self.out_ptr[user_id]:self.out_ptr[user_id + 1]]
+
+    def followers(self, user_id):
+        if user_id >= self.size:
+            return self.in_ids[:0]
+        return self.in_ids[self.in_ptr[user_id]:self.in_ptr[user_id + 1]]
+
+    def sources(self):
+        """Пользователи, у которых есть хотя бы одна подписка."""
+        return np.flatnonzero(np.diff(self.out_ptr)).tolist()
+
+    def _known(self, user_ids):
+        return np.array([user_id for user_id in user_ids
+                         if user_id < self.size], dtype=np.int64)
+
+    def neighbourhood(self, user_ids):
+        """Пользователи, чьи рекомендации зависят от подписок user_ids.
+
+        Это сами user_ids и подписчики, у которых они среди последних
+        max_neighbors подписок: у тех поменялись «друзья друзей».
+
+        Близость по совместным подпискам здесь не распространяется:
+        подписка меняет близость всех авторов, которых читает
+        пользователь, и до полного пересчёта она остаётся прежней.
+        """
+        in_samples = self.sampled[:, self._known(user_ids)].tocoo()
+        return sorted(set(user_ids).union(in_samples.row.tolist()))
+
+    def similarity(self, batch_size=10000):
+        """Близость авторов по совместным подпискам, similar_limit на автора.
+
+        Косинусная близость столбцов матрицы подписок; пересечение
+        подписчиков оценивается по выборке последних подписчиков.
+        """
+        follower_counts = np.diff(self.in_ptr)
+        followers = _latest(self.in_ptr, self.in_ids, self.max_neighbors)
+        sample_sizes = np.diff(followers.indptr)
+        row_scale = np.divide(np.sqrt(follower_counts), sample_sizes,
+                              out=np.zeros(self.size),
+                              where=sample_sizes > 0)
+        column_scale = np.divide(1, np.sqrt(follower_counts),
+                                 out=np.zeros(self.size),
+                                 where=follower_counts > 0)
+        parts = []
+        for start in range(0, self.size, batch_size):
+            counts = (followers[start:start + batch_size]
+                      @ self.sampled).tocoo()
+            rows = counts.row.astype(np.int64) + start
+            other = rows != counts.col
+            rows, columns = rows[other], counts.col[other]
+            values = (counts.data[other] * row_scale[rows]
+                      * column_scale[columns])
+            parts.append(_top_per_row(rows, columns, values,
+                                      self.similar_limit))
+        rows, columns, values = (np.concatenate(part) for part in zip(*parts))
+        return sparse.csr_matrix((values, (rows, columns)),
+                                 shape=(self.size, self.size))
+
+    def candidates(self):
+        """Матрица вкладов: строка — подписка, столбец — кандидат.
+
+        Считается при первом обращении и запоминается на время жизни
+        графа.
+        """
+        if self._candidates is None:
+            self._candidates = self.sampled
+            if self.co_follow_weight:
+                self._candidates = (self.sampled + self.co_follow_weight
+                                    * self.similarity()).tocsr()
+        return self._candidates
+
+    def recommend_many(self, user_ids, top_k):
+        """Лучшие top_k пар (автор, вес) для каждого из user_ids.
+
+        Вес — доля подписок пользователя, которые сами подписаны на
+        автора (друзья друзей), плюс средняя близость автора к подпискам
+        пользователя по совместным подпискам.
+        """
+        results = {user_id: [] for user_id in user_ids}
+        known = self._known(user_ids)
+        if not len(known):
+            return results
+        sampled = self.sampled[known]
+        scores = (sampled @ self.candidates()).tocoo()
+        sample_sizes = np.diff(sampled.indptr)
+        users = known[scores.row]
+        values = scores.data / sample_sizes[scores.row]
+        # Сам пользователь и все его подписки не предлагаются
+        followers, followed = _gather(self.out_ptr, self.out_ids, known)
+        excluded = np.concatenate([known * self.size + known,
+                                   followers * self.size + followed])
+        allowed = ~np.isin(users * self.size + scores.col, excluded)
+        for user_id, author_id, score in zip(*(
+                column.tolist() for column in _top_per_row(
+                    users[allowed], scores.col[allowed], values[allowed],
+                    top_k))):
+            results[user_id].append((author_id, score))
+        return results
+
+    def recommend(self, user_id, top_k):
+        return self.recommend_many([user_id], top_k)[user_id]
+
+
+def load_graph(batch_size=10000):
+    """Читает все подписки в FollowGraph потоковой выборкой."""
+    users, authors = array('I'), array('I')
+    rows = Follow.objects.order_by('pk').values_list('user_id', 'author_id')
+    for user_id, author_id in rows.iterator(chunk_size=batch_size):
+        users.append(user_id)
+        authors.append(author_id)
+    return FollowGraph(
+        users, authors,
+        max_neighbors=settings.RECOMMENDATIONS_MAX_NEIGHBORS,
+        similar_authors=settings.RECOMMENDATIONS_SIMILAR_AUTHORS,
+        co_follow_weight=settings.RECOMMENDATIONS_CO_FOLLOW_WEIGHT)
@@ -0,0 +1,168 @@
+import contextlib
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from . import recommendations, stats, timeline
+from .models import Follow, User
+
+_state = threading.local()
+
+
+class FollowedAuthors:
+    """Отсортированные id авторов, на которых подписан пользователь.
+
+    Хранятся в array('I') — по 4 байта на подписку и в памяти, и в кеше;
+    проверка author_id in followed — двоичный поиск без запросов.
+    """
+
+    def __init__(self, ids=()):
+        self.ids = array('I', sorted(ids))
+
+    @classmethod
+    def from_bytes(cls, data):
+        followed = cls()
+        followed.ids.frombytes(data)
+        return followed
+
+    def to_bytes(self):
+        return self.ids.tobytes()
+
+    def __contains__(self, author_id):
+        position = bisect_left(self.ids, author_id)
+        return position < len(self.ids) and self.ids[position] == author_id
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _followed_key(user_id):
+    return f'followed-authors:{user_id}'
+
+
+def followed_authors(user):
+    """Подписки пользователя: из кеша, при промахе — одним запросом.
+
+    Результат запоминается на объекте user до конца запроса.
+    """
+    if not user.is_authenticated:
+        return FollowedAuthors()
+    followed = getattr(user, '_followed_authors', None)
+    if followed is not None:
+        return followed
+    key = _followed_key(user.pk)
+    data = cache.get(key)
+    if data is None:
+        followed = FollowedAuthors(Follow.objects.filter(
+            user_id=user.pk).order_by().values_list('author_id', flat=True))
+        cache.set(key, followed.to_bytes(),
+                  settings.FOLLOWED_AUTHORS_CACHE_TTL)
+    else:
+        followed = FollowedAuthors.from_bytes(data)
+    user._followed_authors = followed
+    return followed
+
+
+def forget_followed_authors(*user_ids):
+    """Сбрасывает кеш подписок после подписки или отписки."""
+    cache.delete_many(_followed_key(user_id) for user_id in user_ids)
+
+
+def _authors(user, usernames):
+    """id и имена авторов из usernames и признак подписки, одним запросом."""
+    return (User.objects
+            .filter(username__in=usernames)
+            .exclude(pk=user.pk)
+            .annotate(followed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk'))))
+            .values_list('pk', 'username', 'followed'))
+
+
+def _lock(user):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Подписки и отписки одного пользователя через follow() и unfollow()
+    выполняются по очереди, поэтому выбранные до записи новые и
+    удаляемые подписки не устаревают к моменту записи.
+    """
+    User.objects.select_for_update().filter(pk=user.pk).values_list(
+        'pk').get()
+
+
+def in_batch(user_id):
+    """Удаляет ли unfollow() подписки пользователя прямо сейчас.
+
+    Тогда сигналы post_delete на каждую подписку ничего не делают:
+    счётчики и ленту unfollow() обновляет сам, пачкой.
+    """
+    return user_id in getattr(_state, 'batch_users', ())
+
+
+@contextlib.contextmanager
+def _batch(user_id):
+    _state.batch_users = {*getattr(_state, 'batch_users', ()), user_id}
+    try:
+        yield
+    finally:
+        _state.batch_users = _state.batch_users - {user_id}
+
+
+def follow(user, usernames):
+    """Подписывает user сразу на нескольких авторов.
+
+    Возвращает имена авторов, на которых подписка действительно
+    появилась; несуществующие имена, сам user и уже оформленные
+    подписки пропускаются. Сигналы Follow при этом не отправляются,
+    счётчики и лента обновляются здесь же пачкой. Счётчики точны, пока
+    подписки пользователя меняются только через этот модуль, как во
+    views и API.
+    """
+    if not usernames:
+        return []
+    with transaction.atomic():
+        _lock(user)
+        new = {pk: username
+               for pk, username, followed in _authors(user, usernames)
+               if not followed}
+        if not new:
+            return []
+        Follow.objects.bulk_create(
+            [Follow(user=user, author_id=pk) for pk in new],
+            ignore_conflicts=True)
+        stats.bump_many(new, 'followers', 1)
+        stats.bump(user.pk, 'following', len(new))
+        timeline.backfill_authors(user.pk, list(new))
+        recommendations.mark_stale(user.pk)
+    forget_followed_authors(user.pk)
+    return list(new.values())
+
+
+def unfollow(user, usernames):
+    """Отписывает user от авторов одним DELETE, возвращает их имена."""
+    if not usernames:
+        return []
+    with transaction.atomic():
+        _lock(user)
+        rows = (Follow.objects
+                .filter(user=user, author__username__in=usernames)
+                .select_for_update(of=('self',))
+                .values_list('author_id', 'author__username'))
+        removed = dict(rows)
+        if not removed:
+            return []
+        with _batch(user.pk):
+            Follow.objects.filter(user=user, author_id__in=removed).delete()
+        stats.bump_many(removed, 'followers', -1)
+        stats.bump(user.pk, 'following', -len(removed))
+        timeline.prune_authors(user.pk, list(removed))
+        recommendations.mark_stale(user.pk)
+    forget_followed_authors(user.pk)
+    return list(removed.values())
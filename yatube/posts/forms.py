@@ -1,5 +1,12 @@
+import uuid
+
 from django import forms
-from .models import Post, Comment
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+
+from . import images, search
+from .models import Comment, Group, Post, User
 
 
 class PostForm(forms.ModelForm):
@@ -10,6 +17,35 @@ class PostForm(forms.ModelForm):
         widgets = {
             'text': forms.Textarea(attrs={'placeholder': 'Текст поста'})}
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            image, width, height, size = images.normalize(image)
+        except (OSError, Image.DecompressionBombError):
+            # Заголовок прочитался, а сами данные битые или огромные
+            raise forms.ValidationError(
+                self.fields['image'].error_messages['invalid_image'],
+                code='invalid_image')
+        self.image_meta = (width, height, size)
+        return image
+
+    # Лестница размеров прежней картинки; её файлы удаляет
+    # thumbnails.schedule(), когда готова новая
+    stale_renditions = ''
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            width, height, size = getattr(
+                self, 'image_meta', (None, None, None))
+            self.instance.image_width = width
+            self.instance.image_height = height
+            self.instance.image_bytes = size
+            self.stale_renditions = self.instance.image_renditions
+            self.instance.image_renditions = ''
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -18,3 +54,37 @@ class CommentForm(forms.ModelForm):
         labels = {'text': 'Текст'}
         widgets = {
             'text': forms.Textarea(attrs={'placeholder': 'Текст комментария'})}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Ключ идемпотентности — скрытый input рядом с полями формы. Он
+        # новый при каждом показе, поэтому двойная отправка той же формы
+        # сохраняет один комментарий
+        if self.is_bound:
+            self.idempotency_key = self.data.get('idempotency_key', '')
+        else:
+            self.idempotency_key = uuid.uuid4().hex
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(max_length=200, label='Запрос')
+    author = forms.ModelChoiceField(queryset=User.objects.all(),
+                                    to_field_name='username',
+                                    required=False,
+                                    widget=forms.TextInput,
+                                    label='Автор')
+    group = forms.ModelChoiceField(queryset=Group.objects.all(),
+                                   to_field_name='slug',
+                                   required=False,
+                                   widget=forms.TextInput,
+                                   label='Группа')
+
+    def search(self):
+        """id найденных постов по убыванию релевантности."""
+        author = self.cleaned_data['author']
+        group = self.cleaned_data['group']
+        return search.get_backend().search(
+            self.cleaned_data['q'],
+            author_id=author.pk if author else None,
+            group_id=group.pk if group else None,
+            limit=settings.POSTS_SEARCH_MAX_RESULTS)
@@ -0,0 +1,50 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+def normalize(upload):
+    """Приводит загруженную картинку к размеру и формату для хранения.
+
+    Поворачивает по EXIF-ориентации, уменьшает до POST_IMAGE_MAX_SIZE по
+    большей стороне и перекодирует в POST_IMAGE_FORMAT без метаданных.
+    Анимированные картинки сохраняются как есть. Возвращает файл для
+    сохранения, его ширину, высоту и размер в байтах.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload, image.width, image.height, upload.size
+
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    # JPEG декодируется сразу в уменьшенном масштабе, без полного растра.
+    image.draft('RGB', (max_size, max_size))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    image_format = settings.POST_IMAGE_FORMAT
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info)
+    if image_format == 'WEBP' and has_alpha:
+        image = image.convert('RGBA')
+    else:
+        image = image.convert('RGB')
+
+    output = BytesIO()
+    image.save(output, image_format,
+               quality=settings.POST_IMAGE_QUALITY,
+               optimize=True,
+               progressive=True)
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    normalized = SimpleUploadedFile(
+        f'{name}.{EXTENSIONS[image_format]}',
+        output.getvalue(),
+        content_type=CONTENT_TYPES[image_format])
+    return normalized, image.width, image.height, normalized.size
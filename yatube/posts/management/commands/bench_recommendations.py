@@ -0,0 +1,149 @@
+import json
+import random
+import resource
+import sys
+import time
+from array import array
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import recommendations
+from posts.follow_graph import FollowGraph, load_graph
+
+from .bench_views import percentile
+from .seed_data import power_law_weights
+
+
+class Command(BaseCommand):
+    help = ('Замеряет расчёт рекомендаций: построение графа, близость '
+            'авторов, время на пользователя, полный и инкрементальный '
+            'пересчёт, пиковую память. По умолчанию граф синтетический, '
+            'со степенным законом популярности авторов, как seed_data, и '
+            'база не используется. С --database запускается настоящий '
+            'rebuild_recommendations по подпискам из базы, и сохранённые '
+            'рекомендации заменяются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200000)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--exponent', type=float, default=1.1)
+        parser.add_argument(
+            '--database', action='store_true',
+            help='Граф из базы, пересчёты — командой '
+                 'rebuild_recommendations')
+        parser.add_argument(
+            '--sample', type=int, default=5000,
+            help='Скольким пользователям посчитать рекомендации по одному '
+                 'для перцентилей задержки')
+        parser.add_argument(
+            '--stale', type=int, default=1000,
+            help='Сколько пользователей сменили подписки для '
+                 'инкрементального пересчёта')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['random_seed'])
+        started = time.perf_counter()
+        if options['database']:
+            graph = load_graph(options['batch_size'])
+            users = graph.size - 1
+            timings = {'load_seconds': time.perf_counter() - started}
+        else:
+            followers, authors = self.generate(rng, options)
+            generated = time.perf_counter()
+            graph = FollowGraph(
+                followers, authors,
+                max_neighbors=settings.RECOMMENDATIONS_MAX_NEIGHBORS,
+                similar_authors=settings.RECOMMENDATIONS_SIMILAR_AUTHORS,
+                co_follow_weight=settings.RECOMMENDATIONS_CO_FOLLOW_WEIGHT)
+            del followers, authors
+            users = options['users']
+            timings = {
+                'generate_seconds': generated - started,
+                'build_seconds': time.perf_counter() - generated,
+            }
+        sources = graph.sources()
+        if not sources:
+            raise CommandError('В графе нет подписок: сначала выполните '
+                               'seed_data')
+
+        begin = time.perf_counter()
+        graph.candidates()
+        timings['similarity_seconds'] = time.perf_counter() - begin
+        sample = rng.sample(sources, min(options['sample'], len(sources)))
+        latencies = []
+        for user_id in sample:
+            begin = time.perf_counter()
+            graph.recommend(user_id, settings.RECOMMENDATIONS_TOP_K)
+            latencies.append((time.perf_counter() - begin) * 1000)
+        stale = rng.sample(sources, min(options['stale'], len(sources)))
+        affected = graph.neighbourhood(stale)
+
+        if options['database']:
+            # Команда сама читает граф и пишет рекомендации в базу
+            timings['full_rebuild_seconds'] = self.timed(
+                call_command, 'rebuild_recommendations',
+                batch_size=options['batch_size'], stdout=StringIO())
+            recommendations.mark_stale(*stale)
+            timings['incremental_seconds'] = self.timed(
+                call_command, 'rebuild_recommendations', incremental=True,
+                batch_size=options['batch_size'], stdout=StringIO())
+        else:
+            # Граф строится заново и при инкрементальном пересчёте
+            timings['full_rebuild_seconds'] = (
+                timings['build_seconds'] + timings['similarity_seconds']
+                + self.timed(self.recommend_all, graph, sources, options))
+            timings['incremental_seconds'] = (
+                timings['build_seconds'] + timings['similarity_seconds']
+                + self.timed(self.recommend_all, graph, affected, options))
+
+        report = {
+            'meta': {
+                'users': users,
+                'edges': graph.edges,
+                'database': options['database'],
+                'sampled_users': len(sample),
+                'max_neighbors': graph.max_neighbors,
+            },
+            **{name: round(seconds, 2) for name, seconds in timings.items()},
+            'recommend_p50_ms': round(percentile(latencies, 0.50), 3),
+            'recommend_p95_ms': round(percentile(latencies, 0.95), 3),
+            'incremental_users': len(affected),
+            # ru_maxrss в Linux — килобайты
+            'peak_rss_mb': round(resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+        payload = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(payload + '\n')
+        else:
+            sys.stdout.write(payload + '\n')
+
+    def timed(self, function, *args, **kwargs):
+        begin = time.perf_counter()
+        function(*args, **kwargs)
+        return time.perf_counter() - begin
+
+    def recommend_all(self, graph, user_ids, options):
+        batch_size = options['batch_size']
+        for start in range(0, len(user_ids), batch_size):
+            graph.recommend_many(user_ids[start:start + batch_size],
+                                 settings.RECOMMENDATIONS_TOP_K)
+
+    def generate(self, rng, options):
+        users = range(1, options['users'] + 1)
+        weights = power_law_weights(len(users), options['exponent'])
+        followers, authors = array('I'), array('I')
+        for user_id in users:
+            chosen = set(rng.choices(users, cum_weights=weights,
+                                     k=options['follows_per_user']))
+            chosen.discard(user_id)
+            followers.extend([user_id] * len(chosen))
+            authors.extend(chosen)
+        return followers, authors
@@ -0,0 +1,154 @@
+import json
+import math
+import random
+import sys
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post
+
+VIEWS = ('index', 'hot', 'group_posts', 'profile', 'post_view', 'follow_index',
+         'add_comment')
+
+
+def percentile(values, share):
+    """Процентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(math.ceil(share * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет представления posts через тестовый клиент и '
+            'выводит задержки, число запросов и пропускную способность '
+            'в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на каждое представление')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--views', nargs='+', choices=VIEWS,
+                            default=list(VIEWS))
+        parser.add_argument(
+            '--cold-cache', action='store_true',
+            help='Очищать кеш перед каждым запросом')
+        parser.add_argument(
+            '--page-cache', action='store_true',
+            help='Не выключать полностраничный кеш анонимных страниц')
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        page_cache_ttl = (settings.FULL_PAGE_CACHE_TTL
+                          if options['page_cache'] else 0)
+        # Лимит на комментарии отбил бы почти все запросы add_comment
+        with override_settings(FULL_PAGE_CACHE_TTL=page_cache_ttl,
+                               COMMENT_RATE_LIMIT=0):
+            self.run(options)
+
+    def run(self, options):
+        self.random = random.Random(options['random_seed'])
+        self.prepare()
+        report = {
+            'meta': {
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+                'requests': options['requests'],
+                'cold_cache': options['cold_cache'],
+                'page_cache': options['page_cache'],
+                'posts': Post.objects.count(),
+            },
+            'views': {},
+        }
+        for name in options['views']:
+            request = getattr(self, f'request_{name}')
+            for _ in range(options['warmup']):
+                request()
+            report['views'][name] = self.measure(
+                request, options['requests'], options['cold_cache'])
+            self.stderr.write(f'{name}: готово')
+
+        payload = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(payload + '\n')
+        else:
+            sys.stdout.write(payload + '\n')
+
+    def prepare(self):
+        follow = Follow.objects.order_by('?').select_related('user').first()
+        if follow is None:
+            raise CommandError('Нет подписок: сначала выполните seed_data')
+        self.reader = follow.user
+        self.posts = list(Post.objects.order_by('?')
+                          .values_list('pk', 'author__username')[:1000])
+        self.authors = list({username for _, username in self.posts})
+        self.groups = list(Group.objects.values_list('slug', flat=True))
+        self.anonymous = Client()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def measure(self, request, count, cold_cache):
+        latencies, queries = [], []
+        started = time.perf_counter()
+        for _ in range(count):
+            if cold_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                begin = time.perf_counter()
+                response = request()
+                latencies.append((time.perf_counter() - begin) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{response.request["PATH_INFO"]}: '
+                    f'{response.status_code}')
+            queries.append(len(captured))
+        elapsed = time.perf_counter() - started
+        return {
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'queries_mean': round(sum(queries) / count, 2),
+            'queries_max': max(queries),
+            'rps': round(count / elapsed, 1),
+        }
+
+    def random_post(self):
+        return self.random.choice(self.posts)
+
+    def request_index(self):
+        return self.anonymous.get(reverse('posts:index'))
+
+    def request_hot(self):
+        return self.anonymous.get(reverse('posts:hot'))
+
+    def request_group_posts(self):
+        if not self.groups:
+            raise CommandError('Нет групп: сначала выполните seed_data')
+        return self.anonymous.get(reverse(
+            'posts:group', args=[self.random.choice(self.groups)]))
+
+    def request_profile(self):
+        return self.anonymous.get(reverse(
+            'posts:profile', args=[self.random.choice(self.authors)]))
+
+    def request_post_view(self):
+        post_id, username = self.random_post()
+        return self.anonymous.get(reverse(
+            'posts:post', args=[username, post_id]))
+
+    def request_follow_index(self):
+        return self.client.get(reverse('posts:follow_index'))
+
+    def request_add_comment(self):
+        post_id, username = self.random_post()
+        return self.client.post(
+            reverse('posts:add_comment', args=[username, post_id]),
+            {'text': 'Комментарий из бенчмарка'})
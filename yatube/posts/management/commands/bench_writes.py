@@ -0,0 +1,184 @@
+import contextlib
+import json
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+from django.test import override_settings
+
+from posts import comment_writes, hot, stats
+from posts.models import Comment, Group, Post, User
+
+from .bench_views import percentile
+
+KINDS = ('post', 'comment', 'batched-comment')
+TEXT = 'Запись из бенчмарка'
+# Настройки sqlite до появления профиля в settings.DATABASE_OPTIONS
+SQLITE_BASELINE = {
+    'timeout': 5,
+    'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Пишет посты или комментарии из нескольких потоков сразу и '
+            'сравнивает пропускную способность записи со старыми '
+            'настройками базы (baseline) и с текущими (tuned) в JSON. '
+            'batched-comment пишет комментарии через очередь '
+            'COMMENT_WRITE_MODE = \'batch\'. Созданные записи в конце '
+            'удаляются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Потоков, пишущих одновременно')
+        parser.add_argument('--writes', type=int, default=100,
+                            help='Записей на каждый поток')
+        parser.add_argument('--kind', choices=KINDS, default='post')
+        parser.add_argument('--profiles', nargs='+',
+                            choices=('baseline', 'tuned'),
+                            default=['baseline', 'tuned'])
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        self.authors = list(User.objects.values_list('pk', flat=True)[:1000])
+        if not self.authors:
+            raise CommandError('Нет пользователей: сначала выполните '
+                               'seed_data')
+        self.groups = list(Group.objects.values_list('pk', flat=True))
+        self.posts = list(Post.objects.values_list('pk', flat=True)[:1000])
+        batched = options['kind'] == 'batched-comment'
+        if options['kind'] != 'post' and not self.posts:
+            raise CommandError('Нет постов: сначала выполните seed_data')
+        self.write = getattr(self,
+                             f'write_{options["kind"].replace("-", "_")}')
+        report = {
+            'meta': {
+                'database': connection.vendor,
+                'kind': options['kind'],
+                'workers': options['workers'],
+                'writes': options['workers'] * options['writes'],
+            },
+            'profiles': {},
+        }
+        overrides = {}
+        if batched:
+            report['meta']['batch_size'] = settings.COMMENT_BATCH_SIZE
+            overrides = {'COMMENT_WRITE_MODE': 'batch',
+                         'COMMENT_RATE_LIMIT': 0}
+        with override_settings(**overrides):
+            for name in options['profiles']:
+                with self.profile(name == 'baseline') as meta:
+                    stats = self.measure(options)
+                report['profiles'][name] = {**meta, **stats}
+                self.stderr.write(f'{name}: готово')
+
+        payload = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(payload + '\n')
+        else:
+            sys.stdout.write(payload + '\n')
+
+    @contextlib.contextmanager
+    def profile(self, baseline):
+        """Подменяет настройки соединений для всех потоков на время замера.
+
+        baseline — как было до настройки базы: новое соединение на
+        каждую запись, а для sqlite ещё журнал отката и полный fsync.
+        """
+        settings_dict = connection.settings_dict
+        saved = settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE']
+        if baseline:
+            if connection.vendor == 'sqlite':
+                settings_dict['OPTIONS'] = SQLITE_BASELINE
+            settings_dict['CONN_MAX_AGE'] = 0
+        # Режим журнала переключается, только пока других соединений
+        # нет, поэтому его меняет первое соединение до старта потоков
+        connection.close()
+        connection.ensure_connection()
+        meta = {'conn_max_age': settings_dict['CONN_MAX_AGE']}
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                meta['journal_mode'] = cursor.fetchone()[0]
+        # Запись может упасть уже после INSERT (в сигналах), поэтому
+        # удаляются все строки бенчмарка новее этих id
+        last_ids = {model: model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0 for model in (Post, Comment)}
+        try:
+            yield meta
+        finally:
+            connection.close()
+            settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE'] = saved
+            # Упавшие записи могли не сдвинуть счётчики авторов
+            for author_id in self.authors:
+                stats.refresh(author_id)
+            for model, last_id in last_ids.items():
+                model.objects.filter(pk__gt=last_id, text=TEXT).delete()
+            # Удалённые комментарии не вычитаются из оценок «Популярного»
+            Post.objects.bulk_update(
+                hot.recount(Post.objects.filter(pk__in=self.posts).only(
+                    'pub_date', 'hot_score')),
+                ['hot_score'])
+
+    def measure(self, options):
+        latencies, errors = [], []
+        workers = [
+            threading.Thread(
+                target=self.worker,
+                args=(options['writes'],
+                      random.Random(options['random_seed'] + index),
+                      latencies, errors))
+            for index in range(options['workers'])]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        # Поток записи пачками закрывает своё соединение до смены профиля
+        comment_writes.stop_writer()
+        elapsed = time.perf_counter() - started
+        if not latencies:
+            raise CommandError(f'Ни одной записи: {errors[0]}')
+        return {
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'errors': len(errors),
+            'writes_per_second': round(len(latencies) / elapsed, 1),
+        }
+
+    def worker(self, count, rng, latencies, errors):
+        try:
+            for _ in range(count):
+                begin = time.perf_counter()
+                try:
+                    self.write(rng)
+                except OperationalError as error:
+                    errors.append(str(error))
+                else:
+                    latencies.append((time.perf_counter() - begin) * 1000)
+                # Как в конце запроса: соединение закрывается, если
+                # CONN_MAX_AGE истёк или равен нулю
+                close_old_connections()
+        finally:
+            connection.close()
+
+    def write_post(self, rng):
+        group_id = rng.choice(self.groups) if self.groups else None
+        Post.objects.create(author_id=rng.choice(self.authors),
+                            group_id=group_id, text=TEXT)
+
+    def write_comment(self, rng):
+        Comment.objects.create(post_id=rng.choice(self.posts),
+                               author_id=rng.choice(self.authors), text=TEXT)
+
+    def write_batched_comment(self, rng):
+        comment_writes.write(Comment(post_id=rng.choice(self.posts),
+                                     author_id=rng.choice(self.authors),
+                                     text=TEXT))
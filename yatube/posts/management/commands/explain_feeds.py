@@ -0,0 +1,97 @@
+import statistics
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from posts.feeds import feed_queryset
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+
+FEED_INDEXES = [
+    'post_feed_idx',
+    'post_hot_idx',
+    'post_author_feed_idx',
+    'post_group_feed_idx',
+    'comment_post_feed_idx',
+    'follow_author_user_idx',
+    'timeline_user_feed_idx',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Показывает EXPLAIN и время запросов лент без составных '
+            'индексов и с ними')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='POSTS',
+            help='Сначала наполнить базу указанным числом постов')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            call_command('seed_data', posts=options['seed'],
+                         users=max(options['seed'] // 100, 2),
+                         comments=options['seed'] // 10,
+                         stdout=self.stdout)
+        if not Post.objects.exists():
+            raise CommandError('В базе нет постов, используйте --seed')
+        queries = self.queries()
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for name in FEED_INDEXES:
+                        cursor.execute(
+                            f'DROP INDEX {connection.ops.quote_name(name)}')
+                self.report('Без индексов', queries, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        self.report('С индексами', queries, options['repeat'])
+
+    def queries(self):
+        post = Post.objects.order_by('-pub_date', '-id')[:1].get()
+        author = post.author_id
+        group = Group.objects.order_by('?').first()
+        follow = Follow.objects.order_by('?').first()
+        feeds = {
+            'index': feed_queryset(),
+            'index, глубокая страница': feed_queryset().filter(
+                pub_date__lt=post.pub_date),
+            'profile': feed_queryset(Post.objects.filter(author=author)),
+            'comments': Comment.objects.filter(post=post).order_by(
+                '-created', '-id'),
+        }
+        if group is not None:
+            feeds['group'] = feed_queryset(group.posts.all())
+        if follow is not None:
+            feeds['follow_index'] = feed_queryset(
+                Post.objects.filter(author__following__user=follow.user))
+            feeds['is following'] = Follow.objects.filter(
+                author=follow.author, user=follow.user)
+            feeds['timeline'] = TimelineEntry.objects.filter(
+                user=follow.user).order_by('-pub_date', '-post_id')
+        queries = {
+            name: queryset.order_by('-pub_date', '-id')[:11]
+            if queryset.model is Post else queryset[:11]
+            for name, queryset in feeds.items()}
+        queries['hot'] = feed_queryset().order_by('-hot_score', '-id')[:11]
+        return queries
+
+    def report(self, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: медиана {statistics.median(timings):.2f} мс, '
+                f'максимум {max(timings):.2f} мс'))
+            self.stdout.write(queryset.explain())
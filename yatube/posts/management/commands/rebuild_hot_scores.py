@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import caching, hot
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает оценки ленты «Популярное» по публикации и '
+            'комментариям постов. Исправляет накопленную погрешность и '
+            'учитывает удалённые комментарии')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Только посты за последние N дней: старые уже не '
+                 'поднимутся в ленте')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = Post.objects.order_by('pk').only('pub_date', 'hot_score')
+        if options['days'] is not None:
+            rows = rows.filter(pub_date__gte=timezone.now() - timedelta(
+                days=options['days']))
+        total = changed = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                # Блокировка не даёт новому комментарию проскочить между
+                # пересчётом и записью
+                batch = list(rows.filter(pk__gt=last_pk).select_for_update()
+                             [:options['batch_size']])
+                if not batch:
+                    break
+                saved = {post.pk: post.hot_score for post in batch}
+                hot.recount(batch)
+                stale = [post for post in batch
+                         if abs(post.hot_score - saved[post.pk])
+                         > hot.TOLERANCE]
+                Post.objects.bulk_update(stale, ['hot_score'])
+            total += len(batch)
+            changed += len(stale)
+            last_pk = batch[-1].pk
+        if changed:
+            caching.bump(caching.HOT_FEED)
+            caching.purge_pages(caching.HOT_PAGES)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано постов: {total}, изменилось оценок: {changed}'))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import caching, markup
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = ('Перерисовывает HTML постов и комментариев, нарисованный '
+            'старой версией posts.markup, и заново разбирает теги')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перерисовать все записи, а не только устаревшие')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.everything = options['all']
+        posts = self.rebuild(Post, self.render_posts)
+        comments = self.rebuild(Comment, self.render_comments)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перерисовано постов: {posts}, комментариев: {comments} '
+            f'(версия {markup.RENDERER_VERSION})'))
+
+    def rebuild(self, model, render):
+        rows = model.objects.order_by('pk').only('text', 'html_version')
+        if not self.everything:
+            rows = rows.exclude(html_version=markup.RENDERER_VERSION)
+        total = 0
+        last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:self.batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                render(batch)
+            total += len(batch)
+            last_pk = batch[-1].pk
+        return total
+
+    def render_posts(self, posts):
+        for post in posts:
+            markup.prepare(post)
+        Post.objects.bulk_update(posts, ['text_html', 'html_version'])
+        for post in posts:
+            markup.link(post)
+        caching.bump(*(caching.post_card(post.pk) for post in posts))
+
+    def render_comments(self, comments):
+        for comment in comments:
+            markup.render_into(comment)
+        Comment.objects.bulk_update(comments, ['text_html', 'html_version'])
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import follow_graph, recommendations
+from posts.models import Recommendation, StaleRecommendation
+
+
+class Command(BaseCommand):
+    help = ('Считает рекомендации «Кого почитать» по графу подписок: '
+            'друзья друзей и близость по совместным подпискам')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Пересчитать только пользователей, чьи подписки или '
+                 'подписки их подписок изменились с прошлого расчёта')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        # Отметки читаются до загрузки графа: изменения во время расчёта
+        # останутся в очереди до следующего запуска
+        stale = list(StaleRecommendation.objects.values_list(
+            'user_id', flat=True))
+        graph = follow_graph.load_graph(options['batch_size'])
+        if options['incremental']:
+            targets = graph.neighbourhood(stale)
+        else:
+            # Пользователи без подписок теряют старые рекомендации
+            targets = sorted(set(graph.sources()).union(
+                Recommendation.objects.values_list(
+                    'user_id', flat=True).distinct()))
+        top_k = settings.RECOMMENDATIONS_TOP_K
+        batch_size = options['batch_size']
+        for start in range(0, len(targets), batch_size):
+            recommendations.store(graph.recommend_many(
+                targets[start:start + batch_size], top_k))
+        for start in range(0, len(stale), batch_size):
+            StaleRecommendation.objects.filter(
+                user_id__in=stale[start:start + batch_size]).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано пользователей: {len(targets)} '
+            f'(подписок в графе: {graph.edges}, '
+            f'{time.perf_counter() - started:.1f} с)'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry, UserStats
+
+
+class Command(BaseCommand):
+    help = 'Заново заполняет ленты подписок для режима рассылки на запись'
+
+    def handle(self, *args, **options):
+        if not timeline.fan_out_on_write():
+            raise CommandError(
+                "FOLLOW_FEED_STRATEGY должен быть 'write'")
+        TimelineEntry.objects.all().delete()
+        # Авторы под лимитом снова рассылаются: их последние посты
+        # попадут в ленты ниже
+        UserStats.objects.filter(feed_pulled=True).update(feed_pulled=False)
+        follows = Follow.objects.order_by('pk').only('user', 'author')
+        total = 0
+        for follow in follows.iterator():
+            timeline.backfill(follow)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано подписок: {total}'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import User, UserStats
+from posts.stats import COUNTERS, recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики UserStats с нуля и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не записывать')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        fields = list(COUNTERS)
+        created = updated = 0
+        last_pk = 0
+        while True:
+            users = User.objects.filter(pk__gt=last_pk).order_by('pk')
+            batch = list(recount(users[:batch_size]))
+            if not batch:
+                break
+            last_pk = max(stats.user_id for stats in batch)
+            existing = UserStats.objects.in_bulk(
+                [stats.user_id for stats in batch])
+            to_create, to_update = [], []
+            for stats in batch:
+                current = existing.get(stats.user_id)
+                if current is None:
+                    to_create.append(stats)
+                elif any(getattr(current, field) != getattr(stats, field)
+                         for field in fields):
+                    to_update.append(stats)
+            created += len(to_create)
+            updated += len(to_update)
+            if dry_run:
+                continue
+            with transaction.atomic():
+                UserStats.objects.bulk_create(to_create)
+                UserStats.objects.bulk_update(to_update, fields)
+        verb = 'Найдено' if dry_run else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: создано {created}, обновлено {updated}'))
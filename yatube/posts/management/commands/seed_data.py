@@ -0,0 +1,153 @@
+import contextlib
+import itertools
+import random
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import timeline
+from posts.models import Comment, Follow, Group, Post, User
+
+
+@contextlib.contextmanager
+def explicit_dates(*fields):
+    """Временно отключает auto_now_add, чтобы задать даты самим."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def power_law_weights(count, exponent):
+    """Накопленные веса закона Ципфа для random.choices."""
+    return list(itertools.accumulate(
+        1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу реалистичными данными: пользователи, группы, '
+            'посты с распределением авторов по степенному закону, '
+            'комментарии и подписки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows-per-user', type=int, default=20)
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Показатель степенного закона для авторов и комментариев')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить даты')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--random-seed', type=int, default=None)
+        parser.add_argument('--prefix', default='seed')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['random_seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.span = timedelta(days=options['days']).total_seconds()
+        prefix = options['prefix']
+
+        users = self.seed_users(prefix, options['users'])
+        groups = self.seed_groups(prefix, options['groups'])
+        authors = power_law_weights(len(users), options['exponent'])
+        self.seed_posts(options['posts'], users, authors, groups)
+        self.seed_follows(options['follows_per_user'], users, authors)
+        self.seed_comments(options['comments'], users, options['exponent'])
+
+        call_command('rebuild_user_stats', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_hot_scores', stdout=self.stdout)
+        if timeline.fan_out_on_write():
+            call_command('rebuild_timelines', stdout=self.stdout)
+
+    def random_date(self):
+        return self.now - timedelta(seconds=self.random.random() * self.span)
+
+    def bulk(self, model, rows, **kwargs):
+        total = 0
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                return total
+            with transaction.atomic():
+                model.objects.bulk_create(batch, **kwargs)
+            total += len(batch)
+
+    def seed_users(self, prefix, count):
+        self.bulk(User, (User(username=f'{prefix}_user_{i}')
+                         for i in range(count)), ignore_conflicts=True)
+        users = list(User.objects
+                     .filter(username__startswith=f'{prefix}_user_')
+                     .values_list('pk', flat=True))
+        self.stdout.write(f'Пользователей: {len(users)}')
+        return users
+
+    def seed_groups(self, prefix, count):
+        self.bulk(Group, (Group(title=f'Группа {i}',
+                                slug=f'{prefix}-group-{i}',
+                                description='Сгенерированная группа')
+                          for i in range(count)), ignore_conflicts=True)
+        groups = list(Group.objects
+                      .filter(slug__startswith=f'{prefix}-group-')
+                      .values_list('pk', flat=True))
+        self.stdout.write(f'Групп: {len(groups)}')
+        return groups
+
+    def seed_posts(self, count, users, authors, groups):
+        group_choices = groups + [None]
+        choose = self.random.choices
+        rows = (Post(text=f'Сгенерированный пост {i}',
+                     author_id=choose(users, cum_weights=authors)[0],
+                     group_id=self.random.choice(group_choices),
+                     pub_date=self.random_date())
+                for i in range(count))
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            total = self.bulk(Post, rows)
+        self.stdout.write(f'Постов: {total}')
+
+    def seed_follows(self, per_user, users, authors):
+        choose = self.random.choices
+        rows = (Follow(user_id=user, author_id=author)
+                for user in users
+                for author in set(choose(users, cum_weights=authors,
+                                         k=per_user))
+                if author != user)
+        total = self.bulk(Follow, rows, ignore_conflicts=True)
+        self.stdout.write(f'Подписок: {total}')
+
+    def seed_comments(self, count, users, exponent):
+        # Свежие посты обсуждают чаще: вес поста падает с его позицией
+        # в ленте, отсюда «вирусные» посты с тысячами комментариев.
+        posts = list(Post.objects.order_by('-pub_date', '-id')
+                     .values_list('pk', 'pub_date')[:count or 1])
+        if not posts:
+            return
+        weights = power_law_weights(len(posts), exponent)
+        choose = self.random.choices
+
+        def rows():
+            for i in range(count):
+                post, pub_date = choose(posts, cum_weights=weights)[0]
+                age = (self.now - pub_date).total_seconds()
+                yield Comment(
+                    text=f'Сгенерированный комментарий {i}',
+                    author_id=self.random.choice(users),
+                    post_id=post,
+                    created=pub_date + timedelta(
+                        seconds=self.random.random() * age))
+
+        with explicit_dates(Comment._meta.get_field('created')):
+            total = self.bulk(Comment, rows())
+        self.stdout.write(f'Комментариев: {total}')
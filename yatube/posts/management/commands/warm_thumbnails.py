@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заранее создаёт миниатюры для всех картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        images = (Post.objects
+                  .exclude(image='')
+                  .exclude(image__isnull=True)
+                  .order_by('pk')
+                  .values_list('pk', 'image'))
+        total = 0
+        if options['workers'] == 1:
+            for post_id, name in images.iterator():
+                thumbnails.generate(post_id, name)
+                total += 1
+        else:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                for post_id, name in images.iterator():
+                    pool.submit(thumbnails.generate, post_id, name)
+                    total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок обработано: {total}'))
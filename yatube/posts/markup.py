@@ -0,0 +1,97 @@
+import re
+
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Tag, User
+
+TAG_RE = r'(?<![\w#])#(?P<tag>\w{1,%d})' % Tag.NAME_LENGTH
+MENTION_RE = r'(?<![\w@])@(?P<username>\w+(?:[.+-]\w+)*)'
+TOKEN_RE = re.compile(f'{TAG_RE}|{MENTION_RE}')
+
+# Увеличивается при любом изменении render(): записи со старой версией
+# перерисовывает команда rebuild_post_markup
+RENDERER_VERSION = 1
+
+
+def extract(text):
+    """Имена тегов в нижнем регистре и упомянутые имена пользователей."""
+    tags, usernames = [], []
+    for match in TOKEN_RE.finditer(text):
+        if match.group('tag'):
+            tags.append(match.group('tag').lower())
+        else:
+            usernames.append(match.group('username'))
+    return list(dict.fromkeys(tags)), list(dict.fromkeys(usernames))
+
+
+def render(text, usernames=()):
+    """HTML текста как у linebreaksbr, теги и упоминания — ссылками.
+
+    Ссылками становятся только упоминания из usernames, то есть
+    существующих пользователей.
+    """
+    usernames = set(usernames)
+    parts = []
+    position = 0
+    for match in TOKEN_RE.finditer(text):
+        tag, username = match.group('tag', 'username')
+        if tag:
+            url = reverse('posts:tag', args=[tag.lower()])
+        elif username in usernames:
+            url = reverse('posts:profile', args=[username])
+        else:
+            continue
+        parts.append(escape(text[position:match.start()]))
+        parts.append(f'<a href="{escape(url)}">{escape(match.group())}</a>')
+        position = match.end()
+    parts.append(escape(text[position:]))
+    html = ''.join(parts)
+    return html.replace('\r\n', '\n').replace('\r', '\n').replace(
+        '\n', '<br>')
+
+
+def is_current(obj):
+    return obj.html_version == RENDERER_VERSION
+
+
+def body_html(obj):
+    """Готовый HTML текста поста или комментария.
+
+    Для записей, которые ещё не перерисованы под текущую версию,
+    HTML строится на лету без ссылок на упомянутых пользователей.
+    """
+    if is_current(obj):
+        return mark_safe(obj.text_html)
+    return mark_safe(render(obj.text))
+
+
+def render_into(obj):
+    """Заполняет text_html и html_version, возвращает найденное в тексте."""
+    tag_names, usernames = extract(obj.text)
+    mentioned = list(User.objects.filter(username__in=usernames))
+    obj.text_html = render(obj.text, [user.username for user in mentioned])
+    obj.html_version = RENDERER_VERSION
+    return tag_names, mentioned
+
+
+def prepare(post):
+    """Разбирает текст поста перед сохранением и заполняет text_html.
+
+    Теги и упоминания запоминаются на объекте; связи с ними создаёт
+    link() после сохранения, когда у поста уже есть id.
+    """
+    post._markup = render_into(post)
+
+
+def link(post, created=False):
+    tag_names, mentioned = post.__dict__.pop('_markup')
+    tags = [Tag.objects.get_or_create(name=name)[0] for name in tag_names]
+    if created:
+        # У нового поста связей ещё нет, сверять их не нужно
+        post.tags.add(*tags)
+        post.mentions.add(*mentioned)
+        return
+    post.tags.set(tags)
+    post.mentions.set(mentioned)
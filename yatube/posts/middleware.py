@@ -0,0 +1,268 @@
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+_MISSING = object()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_depth = 0
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+def _current():
+    return getattr(_state, 'metrics', None)
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, *args, **kwargs):
+        metrics = _current()
+        if metrics is None or metrics.template_depth:
+            return render(self, *args, **kwargs)
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            metrics.template_ms += (time.perf_counter() - started) * 1000
+            metrics.template_depth -= 1
+    return wrapper
+
+
+def _counted_get(get):
+    @functools.wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        metrics = _current()
+        if metrics is None or metrics.cache_depth:
+            return get(self, key, default, version)
+        metrics.cache_depth += 1
+        try:
+            value = get(self, key, _MISSING, version)
+        finally:
+            metrics.cache_depth -= 1
+        if value is _MISSING:
+            metrics.cache_misses += 1
+            return default
+        metrics.cache_hits += 1
+        return value
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @functools.wraps(get_many)
+    def wrapper(self, keys, version=None):
+        metrics = _current()
+        if metrics is None or metrics.cache_depth:
+            return get_many(self, keys, version)
+        keys = list(keys)
+        metrics.cache_depth += 1
+        try:
+            found = get_many(self, keys, version)
+        finally:
+            metrics.cache_depth -= 1
+        metrics.cache_hits += len(found)
+        metrics.cache_misses += len(keys) - len(found)
+        return found
+    return wrapper
+
+
+def _install_hooks():
+    """Один раз оборачивает рендер шаблонов и чтение из кешей."""
+    if getattr(_install_hooks, 'installed', False):
+        return
+    Template.render = _timed_render(Template.render)
+    for backend in {type(caches[alias]) for alias in settings.CACHES}:
+        backend.get = _counted_get(backend.get)
+        backend.get_many = _counted_get_many(backend.get_many)
+    _install_hooks.installed = True
+
+
+class RequestMetricsMiddleware:
+    """Замеряет запросы к БД, рендер шаблонов, кеш и общее время.
+
+    Включается настройкой REQUEST_METRICS. Пишет JSON-строку в лог
+    posts.middleware и заголовок Server-Timing; запросы сверх бюджетов
+    REQUEST_METRICS_QUERY_BUDGET и REQUEST_METRICS_TIME_BUDGET_MS
+    логируются с уровнем WARNING.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        _install_hooks()
+
+    def __call__(self, request):
+        metrics = _state.metrics = RequestMetrics()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        functools.partial(self.record_query, metrics)))
+                response = self.get_response(request)
+        finally:
+            _state.metrics = None
+        record = self.build_record(request, response, metrics)
+        response['Server-Timing'] = self.server_timing(record)
+        level = logging.WARNING if record['over_budget'] else logging.INFO
+        logger.log(level, json.dumps(record, ensure_ascii=False))
+        return response
+
+    @staticmethod
+    def record_query(metrics, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.queries += 1
+            metrics.sql_ms += (time.perf_counter() - started) * 1000
+
+    @staticmethod
+    def build_record(request, response, metrics):
+        match = request.resolver_match
+        view = None
+        if match is not None:
+            func = getattr(match.func, 'view_class', match.func)
+            view = f'{func.__module__}.{func.__qualname__}'
+        total_ms = metrics.total_ms
+        over_budget = []
+        if metrics.queries > settings.REQUEST_METRICS_QUERY_BUDGET:
+            over_budget.append('queries')
+        if total_ms > settings.REQUEST_METRICS_TIME_BUDGET_MS:
+            over_budget.append('time')
+        return {
+            'method': request.method,
+            'path': request.path,
+            'url_name': match.view_name if match else None,
+            'view': view,
+            'status': response.status_code,
+            'page_cache': getattr(request, 'page_cache', None),
+            'queries': metrics.queries,
+            'sql_ms': round(metrics.sql_ms, 2),
+            'template_ms': round(metrics.template_ms, 2),
+            'cache_hits': metrics.cache_hits,
+            'cache_misses': metrics.cache_misses,
+            'total_ms': round(total_ms, 2),
+            'over_budget': over_budget,
+        }
+
+    @staticmethod
+    def server_timing(record):
+        return ', '.join([
+            f'db;dur={record["sql_ms"]};desc="{record["queries"]} queries"',
+            f'tpl;dur={record["template_ms"]}',
+            (f'cache;desc="{record["cache_hits"]} hits, '
+             f'{record["cache_misses"]} misses"'),
+            f'total;dur={record["total_ms"]}',
+        ])
+
+
+# Страницы в полностраничном кеше и теги, по которым они сбрасываются
+PAGE_CACHE_TAGS = {
+    'posts:index': lambda kwargs: [caching.INDEX_PAGES],
+    'posts:hot': lambda kwargs: [caching.HOT_PAGES],
+    'posts:group': lambda kwargs: [caching.group_pages(kwargs['slug'])],
+    'posts:profile': lambda kwargs: [
+        caching.profile_pages(kwargs['username'])],
+}
+PAGE_CACHE_PARAMS = {'page', 'cursor'}
+
+
+class AnonymousPageCacheMiddleware:
+    """Полностраничный кеш лент для запросов без сессии.
+
+    Ключ складывается из имени маршрута, его аргументов, ?page= или
+    ?cursor= и версий тегов страницы, поэтому caching.purge_pages()
+    сбрасывает только страницы с нужными тегами. Попадания, промахи и
+    сбросы считаются в caching.page_cache_stats(). Выключается
+    FULL_PAGE_CACHE_TTL = 0.
+    """
+
+    def __init__(self, get_response):
+        if not settings.FULL_PAGE_CACHE_TTL:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = self.cache_key(request)
+        if key is None:
+            return self.get_response(request)
+        response = cache.get(key)
+        if response is not None:
+            request.page_cache = 'hit'
+            caching.count_page_cache('hits')
+            return get_conditional_response(
+                request,
+                etag=response.get('ETag'),
+                last_modified=parse_http_date_safe(
+                    response.get('Last-Modified')),
+                response=response)
+        request.page_cache = 'miss'
+        caching.count_page_cache('misses')
+        response = self.get_response(request)
+        if self.cacheable(response):
+            cache.set(key, response, settings.FULL_PAGE_CACHE_TTL)
+        return response
+
+    @staticmethod
+    def cache_key(request):
+        if (request.method != 'GET'
+                or settings.SESSION_COOKIE_NAME in request.COOKIES
+                or not set(request.GET) <= PAGE_CACHE_PARAMS):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        tags = PAGE_CACHE_TAGS.get(match.view_name)
+        if tags is None:
+            return None
+        # Для журнала замеров: при попадании до resolve() дело не дойдёт
+        request.resolver_match = match
+        tags = tags(match.kwargs)
+        versions = caching.get_versions(tags)
+        raw = '|'.join(
+            [match.view_name]
+            + [f'{name}={value}'
+               for name, value in sorted(match.kwargs.items())]
+            + [f'{param}={request.GET.get(param, "")}'
+               for param in sorted(PAGE_CACHE_PARAMS)]
+            + [f'{tag}.{versions[tag]}' for tag in tags])
+        return f'page:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    @staticmethod
+    def cacheable(response):
+        return (response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and 'private' not in response.get('Cache-Control', ''))
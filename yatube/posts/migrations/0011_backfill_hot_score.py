@@ -0,0 +1,61 @@
+# Generated by Django 2.2.6 on 2026-10-18 22:40
+
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+# Формула posts.hot на момент миграции: миграция не зависит от того,
+# как модуль изменится потом
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def event_score(moment, weight):
+    half_lives = ((moment - EPOCH).total_seconds()
+                  / (settings.HOT_FEED_HALF_LIFE * 3600))
+    return math.log(weight) + half_lives * math.log(2)
+
+
+def log_sum(scores):
+    top = max(scores)
+    return top + math.log(sum(math.exp(score - top) for score in scores))
+
+
+def backfill_hot_scores(apps, schema_editor):
+    # После 0010 у всех постов нулевая оценка, и «Популярное» пустое
+    # до первого rebuild_hot_scores
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    rows = Post.objects.order_by('pk').only('pub_date', 'hot_score')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        scores = {post.pk: [event_score(post.pub_date,
+                                        settings.HOT_FEED_POST_WEIGHT)]
+                  for post in batch}
+        comments = Comment.objects.filter(post_id__in=scores).values_list(
+            'post_id', 'created')
+        for post_id, created in comments.iterator():
+            scores[post_id].append(
+                event_score(created, settings.HOT_FEED_COMMENT_WEIGHT))
+        for post in batch:
+            post.hot_score = log_sum(scores[post.pk])
+        Post.objects.bulk_update(batch, ['hot_score'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_hot_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_hot_scores,
+                             migrations.RunPython.noop),
+    ]
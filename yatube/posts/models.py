@@ -22,6 +22,17 @@ class Group(models.Model):
         return self.title
 
 
+class Tag(models.Model):
+    NAME_LENGTH = 50
+
+    name = models.CharField(max_length=NAME_LENGTH,
+                            unique=True,
+                            verbose_name='Тег')
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
 class Post(models.Model):
     text = models.TextField(max_length=200,
                             verbose_name='Пост',
@@ -39,9 +50,42 @@ class Post(models.Model):
                               null=True,
                               related_name='posts')
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    # Заполняются при загрузке, чтобы не открывать файл при выводе
+    image_width = models.PositiveIntegerField(blank=True, null=True)
+    image_height = models.PositiveIntegerField(blank=True, null=True)
+    image_bytes = models.PositiveIntegerField(blank=True, null=True)
+    # JSON-описание лестницы размеров из posts.renditions
+    image_renditions = models.TextField(blank=True, default='',
+                                        editable=False)
+    # Разбираются из текста при публикации и правке, см. posts.markup
+    tags = models.ManyToManyField(Tag,
+                                  blank=True,
+                                  editable=False,
+                                  related_name='posts')
+    mentions = models.ManyToManyField(User,
+                                      blank=True,
+                                      editable=False,
+                                      related_name='mentioned_in')
+    text_html = models.TextField(blank=True, default='', editable=False)
+    # Версия posts.markup, которой нарисован text_html
+    html_version = models.PositiveSmallIntegerField(default=0,
+                                                    editable=False)
+    # Логарифм суммы затухающих весов публикации и комментариев,
+    # см. posts.hot; растёт только на запись
+    hot_score = models.FloatField(default=0, editable=False)
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_feed_idx'),
+            models.Index(fields=['-hot_score', '-id'],
+                         name='post_hot_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_feed_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_feed_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -61,9 +105,16 @@ class Comment(models.Model):
                              blank=True,
                              null=True,
                              related_name='comments')
+    text_html = models.TextField(blank=True, default='', editable=False)
+    html_version = models.PositiveSmallIntegerField(default=0,
+                                                    editable=False)
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_feed_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -82,6 +133,116 @@ class Follow(models.Model):
         constraints = [models.UniqueConstraint(
             fields=['user', 'author'],
             name='uniques')]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} -> {self.author}'
+
+
+class UserStats(models.Model):
+    """Счётчики автора для боковой панели, обновляются сигналами."""
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats')
+    followers = models.PositiveIntegerField(default=0,
+                                            verbose_name='Подписчиков')
+    following = models.PositiveIntegerField(default=0,
+                                            verbose_name='Подписок')
+    posts = models.PositiveIntegerField(default=0,
+                                        verbose_name='Записей')
+    comments = models.PositiveIntegerField(default=0,
+                                           verbose_name='Комментариев')
+    # Пост автора хоть раз не разослался по лентам из-за числа
+    # подписчиков: ленты дочитывают его посты при чтении, пока
+    # rebuild_timelines не разошлёт их заново
+    feed_pulled = models.BooleanField(default=False, editable=False)
+
+    def __str__(self):
+        return f'{self.user}: {self.posts} записей'
+
+
+class Recommendation(models.Model):
+    """Автор, которого стоит предложить пользователю.
+
+    Считается офлайн командой rebuild_recommendations по графу подписок.
+    """
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='recommendations')
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ('-score',)
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'author'],
+            name='recommendation_uniques')]
+        indexes = [
+            models.Index(fields=['user', '-score'],
+                         name='recommendation_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} ? {self.author}: {self.score:.3f}'
+
+
+class StaleRecommendation(models.Model):
+    """Пользователь, у которого с прошлого расчёта изменились подписки."""
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='+')
+
+    def __str__(self):
+        return str(self.user)
+
+
+class TimelineEntry(models.Model):
+    """Пост в ленте подписок пользователя при рассылке на запись."""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='timeline')
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    # Копия Post.pub_date: лента листается по индексу этой таблицы
+    pub_date = models.DateTimeField(editable=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'post'],
+            name='timeline_uniques')]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} <- {self.post_id}'
+
+
+class SearchTerm(models.Model):
+    """Слово поста в инвертированном индексе posts.search."""
+    TERM_LENGTH = 64
+
+    term = models.CharField(max_length=TERM_LENGTH)
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='search_terms')
+    # Сколько раз слово встречается в тексте поста
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'post'],
+                         name='search_term_post_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.term} -> {self.post_id}'
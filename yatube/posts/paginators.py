@@ -0,0 +1,211 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from . import timeline
+
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+def encode_cursor(number, obj, direction, key_field='pub_date'):
+    key = getattr(obj, key_field)
+    key = key.isoformat() if hasattr(key, 'isoformat') else repr(key)
+    raw = f'{number}|{direction}|{key}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def parse_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def decode_cursor(cursor, parse_key=parse_datetime):
+    """Разбирает курсор, для битого курсора возвращает None."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        number, direction, key, pk = raw.split('|')
+        number, pk = int(number), int(pk)
+        key = parse_key(key)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if key is None or number < 1 or direction not in (FORWARD, BACKWARD):
+        return None
+    return number, direction, key, pk
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (pub_date, id) без COUNT(*) и OFFSET.
+
+    Страница выбирается по непрозрачному курсору из ссылок
+    «Предыдущая»/«Следующая». Старые ссылки вида ?page=N обслуживаются
+    для первых settings.POSTS_LEGACY_PAGES страниц.
+    """
+    key_field = 'pub_date'
+    parse_key = staticmethod(parse_datetime)
+
+    def __init__(self, object_list, per_page=None, legacy_pages=None):
+        super().__init__(
+            object_list.order_by(f'-{self.key_field}', '-id'),
+            per_page or settings.POSTS_PER_PAGE)
+        self.legacy_pages = legacy_pages or settings.POSTS_LEGACY_PAGES
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._number = 1
+        self._has_next = False
+
+    @property
+    def num_pages(self):
+        # Точное число страниц неизвестно: достаточно знать,
+        # есть ли страница после текущей.
+        return self._number + 1 if self._has_next else self._number
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return 1
+        return min(max(number, 1), self.legacy_pages)
+
+    def get_page(self, number=None, cursor=None):
+        decoded = decode_cursor(cursor, self.parse_key) if cursor else None
+        if decoded is None:
+            return self.page(number)
+        number, direction, key, pk = decoded
+        if direction == FORWARD:
+            return self._page_after(number, key, pk)
+        return self._page_before(number, key, pk)
+
+    def fetch(self, limit, offset=0, after=None, before=None):
+        """Строки после ключа after или до ключа before — (key, pk).
+
+        С before строки идут от старых к новым.
+        """
+        field = self.key_field
+        rows = self.object_list
+        if after is not None:
+            key, pk = after
+            rows = rows.filter(
+                Q(**{f'{field}__lt': key}) | Q(**{field: key, 'id__lt': pk}))
+        elif before is not None:
+            key, pk = before
+            rows = rows.filter(
+                Q(**{f'{field}__gt': key}) | Q(**{field: key, 'id__gt': pk})
+            ).order_by(field, 'id')
+        return list(rows[offset:offset + limit])
+
+    def page(self, number):
+        number = self.validate_number(number)
+        rows = self.fetch(self.per_page + 1,
+                          offset=(number - 1) * self.per_page)
+        return self._build_page(rows, number)
+
+    def _page_after(self, number, key, pk):
+        rows = self.fetch(self.per_page + 1, after=(key, pk))
+        return self._build_page(rows, number)
+
+    def _page_before(self, number, key, pk):
+        rows = self.fetch(self.per_page + 1, before=(key, pk))
+        if len(rows) <= self.per_page:
+            # Дошли до начала ленты: отдаём свежую первую страницу.
+            return self.page(1)
+        rows = rows[:self.per_page][::-1]
+        return self._build_page(rows, max(number, 2), has_next=True)
+
+    def _build_page(self, rows, number, has_next=None):
+        if has_next is None:
+            has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        self._number = number
+        self._has_next = has_next
+        self.next_cursor = self.previous_cursor = None
+        if has_next and rows:
+            self.next_cursor = encode_cursor(
+                number + 1, rows[-1], FORWARD, self.key_field)
+        if number > 1 and rows:
+            self.previous_cursor = encode_cursor(
+                number - 1, rows[0], BACKWARD, self.key_field)
+        return Page(rows, number, self)
+
+
+class TimelineCursorPaginator(CursorPaginator):
+    """Лента подписок при рассылке на запись.
+
+    Окно страницы ищется по таблице лент (см. timeline.posts_window), а
+    сами посты с аннотациями object_list читаются одним запросом по id.
+    """
+
+    def __init__(self, object_list, user, per_page=None, legacy_pages=None):
+        super().__init__(object_list, per_page, legacy_pages)
+        self.user = user
+
+    def fetch(self, limit, offset=0, after=None, before=None):
+        ids = timeline.posts_window(self.user, limit, offset, after, before)
+        posts = self.object_list.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+class CommentCursorPaginator(CursorPaginator):
+    """Комментарии поста от новых к старым по ключу (created, id)."""
+    key_field = 'created'
+
+    def __init__(self, object_list, per_page=None, legacy_pages=None):
+        super().__init__(object_list,
+                         per_page or settings.COMMENTS_PER_PAGE,
+                         legacy_pages)
+
+
+def paginate(request, object_list):
+    """Возвращает страницу ленты по параметрам ?cursor= или ?page=."""
+    paginator = CursorPaginator(object_list)
+    return paginator.get_page(request.GET.get('page'),
+                              cursor=request.GET.get('cursor'))
+
+
+def paginate_follow(request, object_list):
+    """Страница ленты подписок пользователя запроса.
+
+    object_list — все посты с нужными шаблону аннотациями, отбор по
+    подпискам делается здесь.
+    """
+    if timeline.fan_out_on_write():
+        paginator = TimelineCursorPaginator(object_list, request.user)
+    else:
+        paginator = CursorPaginator(
+            timeline.follow_feed(request.user, object_list))
+    return paginator.get_page(request.GET.get('page'),
+                              cursor=request.GET.get('cursor'))
+
+
+class HotCursorPaginator(CursorPaginator):
+    """Лента «Популярное» по ключу (hot_score, id).
+
+    Оценки растут с новыми комментариями, поэтому при листании пост
+    может подняться на уже просмотренную страницу.
+    """
+    key_field = 'hot_score'
+    parse_key = staticmethod(parse_float)
+
+
+def paginate_hot(request, object_list):
+    paginator = HotCursorPaginator(object_list)
+    return paginator.get_page(request.GET.get('page'),
+                              cursor=request.GET.get('cursor'))
+
+
+def paginate_comments(request, comments):
+    """Порция комментариев с авторами по параметру ?cursor=."""
+    paginator = CommentCursorPaginator(comments.select_related('author'))
+    return paginator.get_page(cursor=request.GET.get('cursor'))
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .models import Recommendation, StaleRecommendation, User, UserStats
+
+POPULAR_KEY = 'recommendations:popular'
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _recommended_key(user_id):
+    return f'recommendations:{user_id}'
+
+
+def store(results):
+    """Заменяет рекомендации пользователей: {user_id: [(author_id, вес)]}."""
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=list(results)).delete()
+        Recommendation.objects.bulk_create(
+            [Recommendation(user_id=user_id, author_id=author_id,
+                            score=score)
+             for user_id, pairs in results.items()
+             for author_id, score in pairs])
+    cache.delete_many(_recommended_key(user_id) for user_id in results)
+
+
+def mark_stale(*user_ids):
+    """Запоминает, что подписки пользователей изменились с расчёта."""
+    StaleRecommendation.objects.bulk_create(
+        [StaleRecommendation(user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True)
+
+
+def mark_stale_on_commit(user_id):
+    """mark_stale() после коммита, если пользователь ещё существует.
+
+    Подписки удаляются и каскадом вместе с подписчиком: отметка,
+    вставленная посреди каскада, ссылалась бы на удалённую строку, и
+    коммит упал бы на внешнем ключе.
+    """
+    def mark():
+        try:
+            with transaction.atomic():
+                mark_stale(user_id)
+        except IntegrityError:
+            pass
+
+    transaction.on_commit(mark)
+
+
+def _authors(user_ids):
+    """Авторы для блока «Кого почитать» без лишних полей User."""
+    found = User.objects.only(*AUTHOR_FIELDS).in_bulk(user_ids)
+    return [found[user_id] for user_id in user_ids if user_id in found]
+
+
+def _recommended_authors(user_id):
+    key = _recommended_key(user_id)
+    authors = cache.get(key)
+    if authors is None:
+        authors = _authors(list(Recommendation.objects.filter(
+            user_id=user_id).values_list('author_id', flat=True)))
+        cache.set(key, authors, settings.FEED_CACHE_TTL)
+    return authors
+
+
+def _popular_authors():
+    authors = cache.get(POPULAR_KEY)
+    if authors is None:
+        authors = _authors(list(
+            UserStats.objects
+            .filter(followers__gt=0)
+            .order_by('-followers', 'user_id')
+            .values_list('user_id', flat=True)
+            [:settings.RECOMMENDATIONS_TOP_K]))
+        cache.set(POPULAR_KEY, authors, settings.FEED_CACHE_TTL)
+    return authors
+
+
+def who_to_follow(user, followed, limit):
+    """Кого предложить пользователю, без авторов из followed.
+
+    Берутся сохранённые рекомендации, а если их ещё нет, — самые
+    популярные авторы. Оба списка читаются из кеша.
+    """
+    authors = [author for author in _recommended_authors(user.pk)
+               if author.pk not in followed]
+    if not authors:
+        authors = [author for author in _popular_authors()
+                   if author.pk not in followed and author.pk != user.pk]
+    return authors[:limit]
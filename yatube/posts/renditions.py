@@ -0,0 +1,132 @@
+import hashlib
+import json
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Post
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'AVIF': 'avif'}
+
+
+def _ordered(formats):
+    """JPEG всегда последний: это запасной вариант для <img>."""
+    formats = list(dict.fromkeys(formats))
+    return [image_format for image_format in formats
+            if image_format != 'JPEG'] + ['JPEG']
+
+
+def available_formats():
+    """Форматы из POST_RENDITION_FORMATS, которые умеет сборка Pillow."""
+    Image.init()
+    return _ordered(image_format
+                    for image_format in settings.POST_RENDITION_FORMATS
+                    if image_format in Image.SAVE)
+
+
+def _crop(image):
+    """Вырезает центр картинки в пропорциях карточки ленты."""
+    ratio_width, ratio_height = settings.POST_RENDITION_ASPECT
+    return ImageOps.fit(image, _fit_size(image, ratio_width / ratio_height),
+                        Image.LANCZOS)
+
+
+def _fit_size(image, ratio):
+    width, height = image.size
+    if width / height > ratio:
+        return round(height * ratio), height
+    return width, round(width / ratio)
+
+
+def build(post_id, name):
+    """Создаёт лестницу размеров картинки и сохраняет её описание в посте.
+
+    Описание — JSON-список {width, height, format, name}, из которого
+    шаблон собирает srcset без обращений к файлам и key-value хранилищу.
+    """
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image.load()
+    image = _crop(ImageOps.exif_transpose(image).convert('RGB'))
+    digest = hashlib.md5(name.encode()).hexdigest()[:12]
+    widths = sorted(settings.POST_RENDITION_WIDTHS)
+    fitting = [width for width in widths if width <= image.width]
+    renditions = []
+    for width in fitting or widths[:1]:
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        for image_format in available_formats():
+            output = BytesIO()
+            resized.save(output, image_format,
+                         quality=settings.POST_IMAGE_QUALITY,
+                         progressive=True)
+            rendition_name = default_storage.save(
+                f'posts/renditions/{post_id}/{digest}_{width}.'
+                f'{EXTENSIONS[image_format]}',
+                ContentFile(output.getvalue()))
+            renditions.append({
+                'width': width,
+                'height': height,
+                'format': image_format,
+                'name': rendition_name,
+            })
+    serialized = json.dumps(renditions)
+    previous = (Post.objects.filter(pk=post_id)
+                .values_list('image_renditions', flat=True).first())
+    updated = Post.objects.filter(pk=post_id, image=name).update(
+        image_renditions=serialized)
+    # Если картинку успели заменить, новая лестница уже не нужна.
+    delete(previous if updated else serialized)
+    return renditions
+
+
+def delete(serialized):
+    """Удаляет файлы устаревшей лестницы размеров."""
+    for rendition in parse(serialized):
+        default_storage.delete(rendition['name'])
+
+
+def parse(serialized):
+    if not serialized:
+        return []
+    return json.loads(serialized)
+
+
+def picture(post):
+    """Данные для <picture>: источники по форматам и запасной <img>."""
+    renditions = parse(post.image_renditions)
+    if not renditions:
+        return None
+    sources = []
+    for image_format in _ordered(rendition['format']
+                                 for rendition in renditions):
+        ladder = [rendition for rendition in renditions
+                  if rendition['format'] == image_format]
+        if not ladder:
+            continue
+        sources.append({
+            'type': CONTENT_TYPES[image_format],
+            'srcset': ', '.join(
+                f'{default_storage.url(rendition["name"])} '
+                f'{rendition["width"]}w'
+                for rendition in ladder),
+            'fallback': ladder[-1],
+        })
+    fallback = sources.pop()
+    image = fallback['fallback']
+    return {
+        'sources': sources,
+        'srcset': fallback['srcset'],
+        'src': default_storage.url(image['name']),
+        'width': image['width'],
+        'height': image['height'],
+        'sizes': settings.POST_RENDITION_SIZES,
+    }
@@ -0,0 +1,147 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+import snowballstemmer
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Sum
+from django.utils.module_loading import import_string
+
+from .models import SearchTerm
+
+WORD_RE = re.compile(r'\w+')
+FTS_TABLE = 'posts_post_fts'
+
+
+@lru_cache(maxsize=None)
+def _stemmer():
+    return snowballstemmer.stemmer(settings.POSTS_SEARCH_LANGUAGE)
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре, приведённые к основе."""
+    words = WORD_RE.findall(text.lower().replace('ё', 'е'))
+    return _stemmer().stemWords(words)
+
+
+class SearchBackend:
+    """Общий интерфейс поисковых индексов постов."""
+
+    def index(self, posts):
+        raise NotImplementedError
+
+    def remove(self, post_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, query, author_id=None, group_id=None, offset=0,
+               limit=10):
+        """id постов по убыванию релевантности."""
+        raise NotImplementedError
+
+
+class SqliteFtsBackend(SearchBackend):
+    """Индекс на виртуальной таблице SQLite FTS5 с ранжированием bm25.
+
+    В таблицу пишутся уже приведённые к основе слова, поэтому поиск
+    находит «котами» по запросу «кот» независимо от токенайзера FTS5.
+    """
+
+    def index(self, posts):
+        rows = [(post.pk, ' '.join(tokenize(post.text)),
+                 post.author_id, post.group_id) for post in posts]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, body, author_id, group_id) '
+                'VALUES (%s, %s, %s, %s)', rows)
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(post_id,) for post_id in post_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, query, author_id=None, group_id=None, offset=0,
+               limit=10):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Основы ищутся как префиксы: «бег» находит и «бега», и «бегущ».
+        match = ' '.join(f'"{term}"*' for term in terms)
+        sql = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [match]
+        if author_id is not None:
+            sql += ' AND author_id = %s'
+            params.append(author_id)
+        if group_id is not None:
+            sql += ' AND group_id = %s'
+            params.append(group_id)
+        sql += ' ORDER BY rank LIMIT %s OFFSET %s'
+        params += [limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class InvertedIndexBackend(SearchBackend):
+    """Инвертированный индекс в обычной таблице SearchTerm.
+
+    Работает на любой СУБД; релевантность — сумма частот слов запроса
+    в посте, при равенстве выше более новые посты.
+    """
+
+    def index(self, posts):
+        posts = list(posts)
+        self.remove([post.pk for post in posts])
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term[:SearchTerm.TERM_LENGTH], post=post,
+                       weight=weight)
+            for post in posts
+            for term, weight in Counter(tokenize(post.text)).items())
+
+    def remove(self, post_ids):
+        SearchTerm.objects.filter(post_id__in=post_ids).delete()
+
+    def clear(self):
+        SearchTerm.objects.all().delete()
+
+    def search(self, query, author_id=None, group_id=None, offset=0,
+               limit=10):
+        terms = {term[:SearchTerm.TERM_LENGTH] for term in tokenize(query)}
+        if not terms:
+            return []
+        matches = SearchTerm.objects.filter(term__in=terms)
+        if author_id is not None:
+            matches = matches.filter(post__author_id=author_id)
+        if group_id is not None:
+            matches = matches.filter(post__group_id=group_id)
+        ranked = (matches
+                  .values('post')
+                  .annotate(matched=Count('term', distinct=True),
+                            score=Sum('weight'))
+                  .filter(matched=len(terms))
+                  .order_by('-score', '-post'))
+        return [row['post'] for row in ranked[offset:offset + limit]]
+
+
+def fts5_available():
+    return connection.vendor == 'sqlite'
+
+
+def get_backend():
+    """Бэкенд из POSTS_SEARCH_BACKEND или FTS5 для SQLite по умолчанию."""
+    if settings.POSTS_SEARCH_BACKEND:
+        return import_string(settings.POSTS_SEARCH_BACKEND)()
+    if fts5_available():
+        return SqliteFtsBackend()
+    return InvertedIndexBackend()
@@ -0,0 +1,94 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import (caching, comment_writes, follows, hot, markup,
+               recommendations, search, stats, timeline)
+from .models import Comment, Follow, Post
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, **kwargs):
+    saved_text = None
+    if instance.pk and not instance._state.adding:
+        # Оценку обновляют комментарии, пока пост открыт на правку:
+        # сохранение не должно затереть её старым значением
+        instance._saved_group_id, saved_text, instance.hot_score = (
+            Post.objects
+            .filter(pk=instance.pk)
+            .values_list('group_id', 'text', 'hot_score')
+            .first() or (None, None, instance.hot_score))
+    else:
+        instance.hot_score = hot.initial_score(instance)
+    if saved_text != instance.text or not markup.is_current(instance):
+        markup.prepare(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if hasattr(instance, '_markup'):
+        markup.link(instance, created)
+    search.get_backend().index([instance])
+    if created:
+        stats.bump(instance.author_id, 'posts', 1)
+        timeline.fan_out(instance)
+        caching.bump_post_feeds(instance)
+        caching.purge_post_pages(instance)
+        return
+    caching.bump(caching.post_card(instance.pk))
+    saved_group_id = getattr(instance, '_saved_group_id', None)
+    if saved_group_id != instance.group_id:
+        caching.bump(*(caching.group_feed(group_id)
+                       for group_id in (saved_group_id, instance.group_id)
+                       if group_id))
+        caching.purge_post_pages(instance, saved_group_id)
+        return
+    caching.purge_post_pages(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    stats.bump(instance.author_id, 'posts', -1)
+    caching.bump_post_feeds(instance)
+    caching.purge_post_pages(instance)
+    search.get_backend().remove([instance.pk])
+
+
+@receiver(pre_save, sender=Comment)
+def comment_changing(sender, instance, **kwargs):
+    markup.render_into(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        comment_writes.comments_created([instance])
+    elif instance.post_id:
+        caching.bump(caching.post_card(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    stats.bump(instance.author_id, 'comments', -1)
+    if instance.post_id:
+        caching.bump(caching.post_card(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(instance.author_id, 'followers', 1)
+        stats.bump(instance.user_id, 'following', 1)
+        timeline.backfill(instance)
+        follows.forget_followed_authors(instance.user_id)
+        recommendations.mark_stale(instance.user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    if follows.in_batch(instance.user_id):
+        return
+    stats.bump(instance.author_id, 'followers', -1)
+    stats.bump(instance.user_id, 'following', -1)
+    timeline.prune(instance)
+    follows.forget_followed_authors(instance.user_id)
+    recommendations.mark_stale_on_commit(instance.user_id)
@@ -0,0 +1,68 @@
+from django.db import IntegrityError, transaction
+from django.db.models import (Count, F, IntegerField, OuterRef, Subquery,
+                              Value)
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+COUNTERS = {
+    'followers': (Follow, 'author'),
+    'following': (Follow, 'user'),
+    'posts': (Post, 'author'),
+    'comments': (Comment, 'author'),
+}
+
+
+def _count_subquery(model, field):
+    rows = (model.objects
+            .filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'))
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def recount(users):
+    """Считает счётчики с нуля для переданного queryset пользователей."""
+    annotations = {
+        f'{name}_total': _count_subquery(model, field)
+        for name, (model, field) in COUNTERS.items()}
+    rows = users.annotate(**annotations).values(
+        'pk', *annotations)
+    for row in rows:
+        yield UserStats(
+            user_id=row['pk'],
+            **{name: row[f'{name}_total'] for name in COUNTERS})
+
+
+def refresh(user_id):
+    """Пересчитывает и сохраняет счётчики одного пользователя."""
+    for stats in recount(User.objects.filter(pk=user_id)):
+        try:
+            with transaction.atomic():
+                stats.save()
+        except IntegrityError:
+            # Пользователь удаляется в этой же транзакции.
+            pass
+
+
+def bump(user_id, counter, delta):
+    """Атомарно сдвигает счётчик; строку создаёт пересчётом при росте."""
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{counter: F(counter) + delta})
+    if not updated and delta > 0:
+        refresh(user_id)
+
+
+def bump_many(user_ids, counter, delta):
+    """bump() для нескольких пользователей одним UPDATE."""
+    user_ids = set(user_ids)
+    updated = UserStats.objects.filter(user_id__in=user_ids).update(
+        **{counter: F(counter) + delta})
+    if updated < len(user_ids) and delta > 0:
+        # Недостающие строки создаются пересчётом, как в bump()
+        missing = User.objects.filter(pk__in=user_ids).exclude(
+            pk__in=UserStats.objects.values('user_id'))
+        UserStats.objects.bulk_create(recount(missing),
+                                      ignore_conflicts=True)
@@ -0,0 +1,24 @@
+from django import template
+
+from posts import renditions, thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post):
+    """Готовая миниатюра картинки поста или None.
+
+    Если миниатюры или лестницы размеров ещё нет, их создание ставится
+    в фоновый пул, а шаблон пока показывает то, что есть.
+    """
+    thumbnail = thumbnails.ready_thumbnail(post.image)
+    if post.image and (thumbnail is None or not post.image_renditions):
+        thumbnails.schedule(post)
+    return thumbnail
+
+
+@register.inclusion_tag('template_blocks/post_picture.html')
+def post_picture(post):
+    """<picture> с srcset по форматам из сохранённой лестницы размеров."""
+    return {'picture': renditions.picture(post)}
@@ -0,0 +1,11 @@
+from django import template
+
+from posts import markup
+
+register = template.Library()
+
+
+@register.filter
+def body_html(obj):
+    """Сохранённый HTML текста поста или комментария."""
+    return markup.body_html(obj)
@@ -0,0 +1,229 @@
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import stats
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                          UserStats)
+
+
+class FeedApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Коты', slug='cats', description='Про котов')
+        cls.author = User.objects.create_user(username='leo')
+        cls.reader = User.objects.create_user(username='anna')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [Post.objects.create(text=f'Пост #{i}', author=cls.author,
+                                         group=cls.group)
+                     for i in range(13)]
+        Comment.objects.create(text='Первый', author=cls.reader,
+                               post=cls.posts[-1])
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_feeds_return_compact_json(self):
+        urls = [
+            reverse('api:index'),
+            reverse('api:group', args=['cats']),
+            reverse('api:profile', args=['leo']),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['Content-Type'],
+                                 'application/json; charset=utf-8')
+                self.assertNotIn(b'": ', response.content)
+                data = response.json()
+                self.assertEqual(len(data['results']), 10)
+                self.assertEqual(data['results'][0]['id'],
+                                 self.posts[-1].pk)
+                self.assertEqual(data['results'][0]['comment_count'], 1)
+                self.assertEqual(data['results'][0]['group'], 'cats')
+                rest = self.client.get(data['next']).json()
+                self.assertEqual(len(rest['results']), 3)
+                self.assertIsNone(rest['next'])
+
+    def test_unchanged_feed_returns_304_without_serializing(self):
+        url = reverse('api:index')
+        response = self.client.get(url)
+        etag, modified = response['ETag'], response['Last-Modified']
+        # Только выборка страницы ленты.
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        cached = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(cached.status_code, 304)
+
+    def test_edits_and_comments_change_etag(self):
+        post = self.posts[-1]
+        urls = [reverse('api:index'), reverse('api:post', args=[post.pk])]
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                Comment.objects.create(text='Ещё', author=self.reader,
+                                       post=post)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                post.text = 'Правка'
+                post.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_post_and_comments(self):
+        post = self.posts[-1]
+        data = self.client.get(reverse('api:post', args=[post.pk])).json()
+        self.assertEqual(data['author'], 'leo')
+        self.assertIn('href="/tags/', data['html'])
+        data = self.client.get(
+            reverse('api:post_comments', args=[post.pk])).json()
+        self.assertEqual([comment['html'] for comment in data['results']],
+                         ['Первый'])
+
+    def test_follow_feed_requires_login(self):
+        url = reverse('api:follow_index')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.reader)
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertNotIn('Last-Modified', response)
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_missing_objects_are_json_404(self):
+        urls = [
+            reverse('api:group', args=['nope']),
+            reverse('api:profile', args=['nobody']),
+            reverse('api:post', args=[0]),
+            reverse('api:post_comments', args=[0]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('detail', response.json())
+
+
+class FollowBatchApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='anna')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(30)]
+        Follow.objects.create(user=cls.reader, author=cls.authors[0])
+        Post.objects.create(text='Пост', author=cls.authors[1])
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.url = reverse('api:follow_batch')
+
+    def post(self, **data):
+        return self.client.post(self.url, json.dumps(data),
+                                content_type='application/json')
+
+    def assert_stats_consistent(self):
+        for expected in stats.recount(User.objects.all()):
+            saved = UserStats.objects.filter(
+                user_id=expected.user_id).first() or UserStats()
+            self.assertEqual(
+                (saved.followers, saved.following),
+                (expected.followers, expected.following))
+
+    def test_follow_and_unfollow_in_one_request(self):
+        response = self.post(
+            follow=['author0', 'author1', 'author2', 'anna', 'nobody'],
+            unfollow=['author0'])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertCountEqual(data['followed'], ['author1', 'author2'])
+        self.assertEqual(data['unfollowed'], ['author0'])
+        self.assertCountEqual(
+            self.reader.follower.values_list('author__username', flat=True),
+            ['author1', 'author2'])
+        self.assert_stats_consistent()
+        data = self.post(follow=['author1'], unfollow=['author3']).json()
+        self.assertEqual(data, {'followed': [], 'unfollowed': []})
+
+    def test_profile_views_share_the_batch_service(self):
+        follow_url = reverse('posts:profile_follow', args=['author1'])
+        unfollow_url = reverse('posts:profile_unfollow', args=['author1'])
+        for _ in range(2):
+            self.client.get(follow_url)
+        self.post(follow=['author1'])
+        self.assertEqual(self.reader.follower.filter(
+            author__username='author1').count(), 1)
+        self.assert_stats_consistent()
+        self.assertEqual(self.client.get(unfollow_url).status_code, 302)
+        self.assertEqual(self.client.get(unfollow_url).status_code, 404)
+        self.assert_stats_consistent()
+
+    def test_query_count_does_not_grow_with_batch(self):
+        names = [author.username for author in self.authors[2:]]
+        counts = []
+        for batch in (names[:2], names[2:]):
+            with CaptureQueriesContext(connection) as follow_queries:
+                self.post(follow=batch)
+            with CaptureQueriesContext(connection) as unfollow_queries:
+                self.post(unfollow=batch)
+            counts.append((len(follow_queries), len(unfollow_queries)))
+        self.assertEqual(counts[0], counts[1])
+        self.assert_stats_consistent()
+
+    @override_settings(FOLLOW_FEED_STRATEGY='write')
+    def test_timeline_backfilled_and_pruned(self):
+        self.post(follow=['author1'])
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader).count(), 1)
+        self.post(unfollow=['author1'])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(FOLLOW_FEED_STRATEGY='write', FOLLOW_FEED_BACKFILL=2)
+    def test_backfill_queries_do_not_grow_with_batch(self):
+        for author in self.authors[2:]:
+            for i in range(3):
+                Post.objects.create(text=f'Пост {i}', author=author)
+        names = [author.username for author in self.authors[2:]]
+        counts = []
+        for batch in (names[:2], names[2:]):
+            with CaptureQueriesContext(connection) as queries:
+                self.post(follow=batch)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        latest = {author: list(Post.objects.filter(
+            author=author).values_list('pk', flat=True)[:2])
+            for author in self.authors[2:]}
+        self.assertCountEqual(
+            TimelineEntry.objects.filter(user=self.reader).values_list(
+                'post_id', flat=True),
+            [pk for posts in latest.values() for pk in posts])
+
+    @override_settings(FOLLOW_BATCH_LIMIT=2)
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        bad_bodies = [
+            'not json',
+            json.dumps(['author1']),
+            json.dumps({'follow': 'author1'}),
+            json.dumps({'follow': [1]}),
+            json.dumps({'follow': ['author1', 'author2'],
+                        'unfollow': ['author0']}),
+        ]
+        for body in bad_bodies:
+            with self.subTest(body=body):
+                response = self.client.post(
+                    self.url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('detail', response.json())
+        self.client.logout()
+        self.assertEqual(self.post(follow=['author1']).status_code, 401)
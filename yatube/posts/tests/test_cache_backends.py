@@ -0,0 +1,111 @@
+import fakeredis
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django_redis.cache import RedisCache
+
+from posts import caching
+from posts.models import Comment, Post, User
+
+# Один сервер на модуль: django-redis держит пулы соединений по адресу
+SERVER = fakeredis.FakeServer()
+LOCATION = 'redis://127.0.0.1:6379/0'
+# Порт, на котором никто не слушает
+UNAVAILABLE = 'redis://127.0.0.1:1/0'
+
+
+def redis_options(**options):
+    return {
+        **settings.CACHE_OPTIONS['redis'],
+        'CONNECTION_POOL_KWARGS': {
+            'connection_class': fakeredis.FakeConnection,
+            'server': SERVER,
+        },
+        **options,
+    }
+
+
+def redis_caches(location=LOCATION, **options):
+    return {'default': {
+        'BACKEND': settings.CACHE_BACKENDS['redis'],
+        'LOCATION': location,
+        'KEY_PREFIX': 'yatube',
+        'OPTIONS': redis_options(**options),
+    }}
+
+
+class RedisCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = self.make_cache()
+        self.raw = self.cache.client.get_client()
+        self.raw.flushdb()
+
+    def make_cache(self, key_prefix='test'):
+        return RedisCache(LOCATION, {'KEY_PREFIX': key_prefix,
+                                     'OPTIONS': redis_options()})
+
+    def test_incr_is_atomic_and_keeps_ttl(self):
+        self.cache.set('counter', 5, 60)
+        self.assertEqual(self.cache.incr('counter'), 6)
+        self.assertEqual(self.cache.decr('counter', 2), 4)
+        self.assertEqual(self.raw.get('test:1:counter'), b'4')
+        self.assertGreater(self.raw.ttl('test:1:counter'), 0)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.assertFalse(self.raw.exists('test:1:missing'))
+
+    def test_add_only_sets_missing_keys(self):
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 1)
+
+    def test_key_prefix_separates_projects(self):
+        other = self.make_cache('other')
+        self.cache.set('key', 'test')
+        other.set('key', 'other')
+        self.assertEqual(self.cache.get('key'), 'test')
+        self.assertEqual(other.get('key'), 'other')
+
+    def test_large_values_are_compressed(self):
+        page = '<div class="card">пост</div>' * 200
+        self.cache.set('page', page)
+        self.assertLess(len(self.raw.get('test:1:page')),
+                        len(page.encode()) // 10)
+        self.assertEqual(self.cache.get('page'), page)
+
+
+class SharedCacheIntegrationTest(TestCase):
+    def setUp(self):
+        settings_override = override_settings(CACHES=redis_caches())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.author = User.objects.create_user(username='Poster')
+        self.post = Post.objects.create(text='Пост', author=self.author)
+
+    def test_feed_fragments_and_versions_live_in_shared_cache(self):
+        self.client.get(reverse('posts:index'))
+        keys = [key.decode()
+                for key in cache.client.get_client().keys('*')]
+        self.assertTrue(any('template.cache.index_page' in key
+                            for key in keys))
+        self.assertTrue(any(key.endswith(f'version:{caching.INDEX_FEED}')
+                            for key in keys))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_unavailable_redis_degrades_to_misses(self):
+        with override_settings(CACHES=redis_caches(
+                UNAVAILABLE, CONNECTION_POOL_KWARGS={})):
+            with self.assertLogs('django_redis', 'ERROR'):
+                self.assertIsNone(cache.get('key'))
+                response = self.client.get(reverse('posts:index'))
+                self.assertContains(response, 'Пост')
+                self.client.force_login(self.author)
+                self.client.post(
+                    reverse('posts:add_comment',
+                            args=[self.author.username, self.post.pk]),
+                    {'text': 'Без кеша', 'idempotency_key': 'key'})
+        self.assertTrue(Comment.objects.filter(text='Без кеша').exists())
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from posts.models import Comment, Follow, Post, User, UserStats
+
+
+class SeedAndBenchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'seed_data', users=20, groups=3, posts=60, comments=40,
+            follows_per_user=5, random_seed=1, stdout=StringIO())
+
+    def test_seed_data_creates_dataset(self):
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertTrue(Follow.objects.exists())
+        self.assertEqual(UserStats.objects.count(), User.objects.count())
+        dates = Post.objects.values_list('pub_date', flat=True)
+        self.assertGreater(len(set(dates)), 1)
+
+    def test_bench_views_writes_json_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            call_command('bench_views', requests=3, warmup=1,
+                         output=path, stderr=StringIO())
+            with open(path) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(report['meta']['posts'], 60)
+        for name, stats in report['views'].items():
+            with self.subTest(view=name):
+                self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+                self.assertGreater(stats['queries_mean'], 0)
+
+
+class BenchWritesTest(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='writer')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+
+    def test_bench_writes_compares_profiles_and_cleans_up(self):
+        for kind in ('post', 'comment', 'batched-comment'):
+            with self.subTest(kind=kind):
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, 'bench.json')
+                    call_command('bench_writes', workers=2, writes=3,
+                                 kind=kind, output=path, stderr=StringIO())
+                    with open(path) as report_file:
+                        report = json.load(report_file)
+                self.assertEqual(report['meta']['writes'], 6)
+                self.assertEqual(
+                    report['profiles']['baseline']['conn_max_age'], 0)
+                for stats in report['profiles'].values():
+                    self.assertGreater(stats['writes_per_second'], 0)
+                self.assertEqual(Post.objects.count(), 1)
+                self.assertEqual(Comment.objects.count(), 0)
+                self.assertEqual(
+                    UserStats.objects.get(user=self.author).posts, 1)
@@ -0,0 +1,127 @@
+import warnings
+
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.test import Client, TestCase, TransactionTestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from posts import caching, comment_writes, hot
+from posts.models import Comment, Post, User, UserStats
+
+
+class CommentWritesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.url = reverse('posts:add_comment',
+                           args=[self.author.username, self.post.pk])
+
+    def test_form_carries_fresh_idempotency_key(self):
+        post_url = reverse('posts:post',
+                           args=[self.author.username, self.post.pk])
+        keys = [self.client.get(post_url).context['form'].idempotency_key
+                for _ in range(2)]
+        self.assertNotEqual(keys[0], keys[1])
+        self.assertContains(self.client.get(post_url),
+                            'name="idempotency_key"')
+
+    def test_double_submit_saves_once(self):
+        data = {'text': 'Привет', 'idempotency_key': 'form-1'}
+        for _ in range(2):
+            response = self.client.post(self.url, data)
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(Comment.objects.filter(text='Привет').count(), 1)
+        self.client.post(self.url, {'text': 'Привет'},
+                         HTTP_IDEMPOTENCY_KEY='header-1')
+        self.assertEqual(Comment.objects.filter(text='Привет').count(), 2)
+
+    def test_any_header_key_is_safe_for_memcached(self):
+        key = 'ключ с пробелами\t' * 30
+        with warnings.catch_warnings():
+            # locmem предупреждает о ключах, которые отверг бы memcached
+            warnings.simplefilter('error', CacheKeyWarning)
+            for _ in range(2):
+                response = self.client.post(self.url, {'text': 'Привет'},
+                                            HTTP_IDEMPOTENCY_KEY=key)
+                self.assertEqual(response.status_code, 302)
+        self.assertEqual(Comment.objects.filter(text='Привет').count(), 1)
+
+    @override_settings(COMMENT_RATE_LIMIT=2)
+    def test_rate_limit(self):
+        for i in range(2):
+            response = self.client.post(self.url, {'text': f'Текст {i}'})
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(
+            self.url, {'text': 'Лишний', 'idempotency_key': 'late'})
+        self.assertEqual(response.status_code, 429)
+        self.assertLessEqual(int(response['Retry-After']), 60)
+        self.assertEqual(Comment.objects.count(), 2)
+        # Отклонённая отправка не занимает ключ: после паузы её повторят
+        self.assertTrue(comment_writes.claim(self.reader.pk, 'late'))
+
+    def test_save_batch_matches_signals(self):
+        other = Post.objects.create(text='Другой пост', author=self.author)
+        versions = caching.get_versions([caching.post_card(self.post.pk)])
+        comment_writes.save_batch([
+            Comment(post=post, author=self.reader, text=f'@author {i}')
+            for i, post in enumerate([self.post, self.post, other])])
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).comments, 3)
+        self.assertIn('/author/',
+                      Comment.objects.filter(post=other).get().text_html)
+        for post in Post.objects.filter(pk__in=[self.post.pk, other.pk]):
+            with self.subTest(post=post.pk):
+                self.assertAlmostEqual(
+                    post.hot_score,
+                    hot.recount(Post.objects.filter(pk=post.pk))[0]
+                    .hot_score, places=6)
+        self.assertNotEqual(
+            caching.get_versions([caching.post_card(self.post.pk)]),
+            versions)
+
+
+@override_settings(COMMENT_WRITE_MODE='batch', COMMENT_RATE_LIMIT=0)
+class CommentWriterTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(text='Пост', author=self.author)
+
+    def tearDown(self):
+        comment_writes.stop_writer()
+
+    def test_view_waits_for_its_batch(self):
+        client = Client()
+        client.force_login(self.author)
+        response = client.post(
+            reverse('posts:add_comment',
+                    args=[self.author.username, self.post.pk]),
+            {'text': 'Из очереди'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Comment.objects.filter(text='Из очереди').exists())
+
+    def test_failed_batch_falls_back_to_single_writes(self):
+        writer = comment_writes.CommentWriter(linger=0.2)
+        with self.assertLogs('posts.comment_writes', 'ERROR'):
+            good = writer.submit(
+                Comment(post=self.post, author=self.author, text='Хороший'))
+            bad = writer.submit(
+                Comment(post_id=self.post.pk + 100, author=self.author,
+                        text='Без поста'))
+            self.assertIsNotNone(good.result(timeout=5).pk)
+            self.assertIsNotNone(bad.exception(timeout=5))
+            writer.stop()
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)),
+            ['Хороший'])
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).comments, 1)
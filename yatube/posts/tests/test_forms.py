@@ -1,9 +1,12 @@
 import shutil
 import tempfile
+from io import BytesIO
 from django.db.models.fields.files import ImageFieldFile
 from django.conf import settings
-from django.test import Client, TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 from posts.models import Post, Group, User, Comment
 
 
@@ -179,3 +182,69 @@ class CommentCreateFormTests(TestCase):
                     'post_id': self.post.id}))
         comments_cnt_after_guest_response = Comment.objects.count()
         self.assertEqual(comments_cnt_after_guest_response, comments_cnt)
+
+
+@override_settings(THUMBNAIL_ASYNC=False, POST_IMAGE_MAX_SIZE=400)
+class ImageUploadFormTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Tester')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    @staticmethod
+    def phone_photo():
+        """Снимок 1200x600, который камера записала повёрнутым."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera maker'
+        file_obj = BytesIO()
+        Image.new('RGB', (1200, 600), 'red').save(
+            file_obj, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile(
+            'photo.jpeg', file_obj.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_normalized(self):
+        self.authorized_client.post(
+            reverse('posts:new_post'),
+            {'text': 'Фото', 'image': self.phone_photo()})
+        post = Post.objects.get(text='Фото')
+        self.assertEqual((post.image_width, post.image_height), (200, 400))
+        self.assertEqual(post.image_bytes, post.image.size)
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (200, 400))
+            self.assertEqual(len(stored.getexif()), 0)
+            self.assertIn('progressive', stored.info)
+
+    @override_settings(POST_IMAGE_FORMAT='WEBP')
+    def test_webp_format(self):
+        self.authorized_client.post(
+            reverse('posts:new_post'),
+            {'text': 'Фото', 'image': self.phone_photo()})
+        post = Post.objects.get(text='Фото')
+        self.assertTrue(post.image.name.endswith('.webp'))
+
+    def test_truncated_upload_is_form_error(self):
+        photo = self.phone_photo()
+        truncated = SimpleUploadedFile(
+            'photo.jpeg', photo.read()[:len(photo) // 2],
+            content_type='image/jpeg')
+        response = self.authorized_client.post(
+            reverse('posts:new_post'), {'text': 'Фото', 'image': truncated})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error(
+            'image', 'invalid_image'))
+        self.assertFalse(Post.objects.filter(text='Фото').exists())
@@ -0,0 +1,111 @@
+import importlib
+from datetime import timedelta
+from io import StringIO
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import hot
+from posts.models import Comment, Post, User
+
+
+@override_settings(POSTS_PER_PAGE=2, FULL_PAGE_CACHE_TTL=0)
+class HotFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.posts = [Post.objects.create(text=f'Пост {i}',
+                                          author=self.author)
+                      for i in range(3)]
+
+    def comment(self, post, count=1):
+        for i in range(count):
+            Comment.objects.create(text=f'Комментарий {i}',
+                                   author=self.reader, post=post)
+
+    def hot_feed(self, **params):
+        response = Client().get(reverse('posts:hot'), params)
+        return response, [post.pk for post in response.context['page']]
+
+    def test_discussed_post_rises(self):
+        first, second, third = self.posts
+        _, ids = self.hot_feed()
+        self.assertEqual(ids, [third.pk, second.pk])
+        self.comment(first, 3)
+        _, ids = self.hot_feed()
+        self.assertEqual(ids, [first.pk, third.pk])
+
+    def test_old_activity_decays(self):
+        old = self.posts[0]
+        self.comment(old, 5)
+        week_ago = timezone.now() - timedelta(days=7)
+        Post.objects.filter(pk=old.pk).update(pub_date=week_ago)
+        Comment.objects.filter(post=old).update(created=week_ago)
+        call_command('rebuild_hot_scores', stdout=StringIO())
+        # Неделя — 14 периодов полураспада: пяти комментариев мало
+        _, ids = self.hot_feed()
+        self.assertNotIn(old.pk, ids)
+
+    def test_incremental_score_matches_recount(self):
+        post = self.posts[0]
+        self.comment(post, 4)
+        post.refresh_from_db()
+        recounted = hot.recount(Post.objects.filter(pk=post.pk))[0]
+        self.assertAlmostEqual(post.hot_score, recounted.hot_score,
+                               places=6)
+
+    def test_edit_keeps_score(self):
+        post = Post.objects.get(pk=self.posts[0].pk)
+        self.comment(post, 2)
+        post.text = 'Исправленный текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertAlmostEqual(
+            post.hot_score,
+            hot.recount(Post.objects.filter(pk=post.pk))[0].hot_score)
+
+    def test_cursor_walks_feed_by_score(self):
+        self.comment(self.posts[1], 2)
+        response, ids = self.hot_feed()
+        self.assertNotIn('Last-Modified', response)
+        paginator = response.context['page'].paginator
+        _, next_ids = self.hot_feed(cursor=paginator.next_cursor)
+        self.assertEqual(ids + next_ids,
+                         [self.posts[1].pk, self.posts[2].pk,
+                          self.posts[0].pk])
+
+    def test_comment_invalidates_anonymous_etag(self):
+        response, _ = self.hot_feed()
+        etag = response['ETag']
+        self.comment(self.posts[0])
+        response = Client().get(reverse('posts:hot'),
+                                HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebuild_forgets_deleted_comments(self):
+        post = self.posts[0]
+        self.comment(post, 3)
+        Comment.objects.filter(post=post).delete()
+        out = StringIO()
+        call_command('rebuild_hot_scores', batch_size=2, stdout=out)
+        post.refresh_from_db()
+        self.assertAlmostEqual(post.hot_score, hot.initial_score(post))
+        self.assertIn('изменилось оценок: 1', out.getvalue())
+
+    def test_migration_backfills_scores(self):
+        self.comment(self.posts[0], 2)
+        Post.objects.update(hot_score=0)
+        migration = importlib.import_module(
+            'posts.migrations.0011_backfill_hot_score')
+        migration.backfill_hot_scores(apps, None)
+        for post in Post.objects.all():
+            with self.subTest(post=post.pk):
+                self.assertAlmostEqual(
+                    post.hot_score,
+                    hot.recount(Post.objects.filter(pk=post.pk))[0]
+                    .hot_score, places=6)
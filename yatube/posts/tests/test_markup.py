@@ -0,0 +1,110 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import markup
+from posts.models import Comment, Post, Tag, User
+
+
+class MarkupTest(TestCase):
+    def test_extract_tags_and_mentions(self):
+        tags, usernames = markup.extract(
+            '#Коты и #коты, @leo.tolstoy! почта a@b.ru, c#sharp')
+        self.assertEqual(tags, ['коты'])
+        self.assertEqual(usernames, ['leo.tolstoy'])
+
+    def test_render_escapes_text_and_links_known_users(self):
+        html = markup.render('<b>#кот</b>\n@leo @ghost', ['leo'])
+        self.assertEqual(
+            html,
+            '&lt;b&gt;<a href="/tags/%D0%BA%D0%BE%D1%82/">#кот</a>'
+            '&lt;/b&gt;<br><a href="/leo/">@leo</a> @ghost')
+
+
+class PostMarkupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='leo')
+        self.reader = User.objects.create_user(username='anna')
+        self.client.force_login(self.author)
+
+    def test_new_post_stores_tags_mentions_and_html(self):
+        self.client.post(reverse('posts:new_post'),
+                         {'text': 'Привет, @anna! #Коты #весна'})
+        post = Post.objects.get()
+        self.assertEqual(
+            set(post.tags.values_list('name', flat=True)),
+            {'коты', 'весна'})
+        self.assertEqual(list(post.mentions.all()), [self.reader])
+        self.assertIn('<a href="/anna/">@anna</a>', post.text_html)
+
+    def test_edit_updates_tags(self):
+        post = Post.objects.create(text='#старый', author=self.author)
+        self.client.post(
+            reverse('posts:post_edit', args=['leo', post.pk]),
+            {'text': '#новый'})
+        post.refresh_from_db()
+        self.assertEqual(list(post.tags.values_list('name', flat=True)),
+                         ['новый'])
+        self.assertIn('#новый', post.text_html)
+
+    def test_tag_feed_lists_tagged_posts_newest_first(self):
+        first = Post.objects.create(text='#кот раз', author=self.author)
+        Post.objects.create(text='без тега', author=self.author)
+        second = Post.objects.create(text='#Кот два', author=self.author)
+        response = self.client.get(reverse('posts:tag', args=['Кот']))
+        self.assertEqual(list(response.context['page']), [second, first])
+        self.assertContains(response, '>#Кот</a> два')
+
+    def test_unknown_tag_is_404(self):
+        response = self.client.get(reverse('posts:tag', args=['нет']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_rebuild_post_markup_fills_bulk_created_posts(self):
+        Post.objects.bulk_create([Post(text='#импорт', author=self.author)])
+        call_command('rebuild_post_markup', stdout=StringIO())
+        post = Post.objects.get()
+        self.assertIn('#импорт</a>', post.text_html)
+        self.assertTrue(Tag.objects.get(name='импорт').posts.exists())
+
+
+class RendererVersionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='leo')
+        self.post = Post.objects.create(text='#кот\n<i>', author=self.author)
+
+    def test_post_and_comment_html_is_rendered_on_save(self):
+        comment = Comment.objects.create(
+            text='@leo, <script>', author=self.author, post=self.post)
+        self.assertEqual(self.post.html_version, markup.RENDERER_VERSION)
+        self.assertEqual(comment.html_version, markup.RENDERER_VERSION)
+        self.assertEqual(comment.text_html,
+                         '<a href="/leo/">@leo</a>, &lt;script&gt;')
+        response = Client().get(
+            reverse('posts:post', args=['leo', self.post.pk]))
+        self.assertContains(response, '<a href="/leo/">@leo</a>, &lt;script')
+
+    def test_stale_rows_render_on_the_fly(self):
+        Post.objects.filter(pk=self.post.pk).update(
+            text_html='устарело', html_version=0)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertNotIn('устарело', markup.body_html(post))
+        self.assertIn('#кот</a><br>&lt;i&gt;', markup.body_html(post))
+
+    def test_command_rerenders_only_stale_rows(self):
+        Comment.objects.create(text='текст', author=self.author,
+                               post=self.post)
+        with mock.patch.object(markup, 'RENDERER_VERSION', 2):
+            out = StringIO()
+            call_command('rebuild_post_markup', stdout=out)
+            self.assertIn('постов: 1, комментариев: 1', out.getvalue())
+            self.assertEqual(
+                Post.objects.get(pk=self.post.pk).html_version, 2)
+            call_command('rebuild_post_markup', stdout=out)
+            self.assertIn('постов: 0, комментариев: 0', out.getvalue())
@@ -0,0 +1,128 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts import caching
+from posts.models import Group, Post, User
+
+
+@override_settings(REQUEST_METRICS=True)
+class RequestMetricsMiddlewareTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username='Poster')
+        for i in range(3):
+            Post.objects.create(text=f'Пост {i}', author=author)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_index(self):
+        with self.assertLogs('posts.middleware', 'INFO') as logs:
+            response = self.client.get(reverse('posts:index'))
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_record_and_server_timing(self):
+        response, record = self.get_index()
+        self.assertEqual(record['url_name'], 'posts:index')
+        self.assertEqual(record['view'], 'posts.views.index')
+        self.assertEqual(record['queries'], 1)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertGreater(record['cache_misses'], 0)
+        self.assertEqual(record['over_budget'], [])
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+        _, record = self.get_index()
+        self.assertGreater(record['cache_hits'], 0)
+
+    @override_settings(REQUEST_METRICS_QUERY_BUDGET=0)
+    def test_over_budget_requests_are_warnings(self):
+        with self.assertLogs('posts.middleware', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['over_budget'], ['queries'])
+
+    @override_settings(REQUEST_METRICS=False)
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+@override_settings(FULL_PAGE_CACHE_TTL=60)
+class AnonymousPageCacheMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Poster')
+        self.other = User.objects.create_user(username='Other')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.other_group = Group.objects.create(
+            title='Другая', slug='other', description='Описание')
+        Post.objects.create(text='Пост', author=self.author,
+                            group=self.group)
+        self.urls = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group', args=['group']),
+            'other_group': reverse('posts:group', args=['other']),
+            'profile': reverse('posts:profile', args=['Poster']),
+            'other_profile': reverse('posts:profile', args=['Other']),
+        }
+
+    def warm(self):
+        for url in self.urls.values():
+            self.client.get(url)
+
+    def test_repeated_anonymous_requests_are_served_from_cache(self):
+        self.warm()
+        for url in self.urls.values():
+            with self.subTest(url=url):
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNone(response.context)
+        stats = caching.page_cache_stats()
+        self.assertEqual(stats['hits'], 5)
+        self.assertEqual(stats['misses'], 5)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_new_post_purges_only_its_pages(self):
+        self.warm()
+        caching.reset_page_cache_stats()
+        Post.objects.create(text='Новый', author=self.author,
+                            group=self.group)
+        fresh = {'index', 'group', 'profile'}
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.client.get(url)
+                self.assertEqual(response.context is not None,
+                                 name in fresh)
+        self.assertContains(self.client.get(self.urls['group']), 'Новый')
+        self.assertEqual(caching.page_cache_stats()['purges'], 4)
+
+    def test_moving_post_purges_both_groups(self):
+        self.warm()
+        post = Post.objects.get()
+        post.group = self.other_group
+        post.save()
+        for name in ('group', 'other_group'):
+            with self.subTest(page=name):
+                response = self.client.get(self.urls[name])
+                self.assertIsNotNone(response.context)
+
+    def test_requests_with_session_or_extra_params_bypass_cache(self):
+        self.warm()
+        self.client.force_login(self.other)
+        self.assertIsNotNone(self.client.get(self.urls['index']).context)
+        self.client.logout()
+        response = self.client.get(self.urls['index'], {'utm': '1'})
+        self.assertIsNotNone(response.context)
+
+    def test_cached_page_answers_conditional_requests(self):
+        etag = self.client.get(self.urls['index'])['ETag']
+        response = self.client.get(self.urls['index'],
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
@@ -1,5 +1,8 @@
+from io import StringIO
+
 from django.test import TestCase
-from posts.models import Post, Group, User
+from django.core.management import call_command
+from posts.models import Comment, Follow, Group, Post, User, UserStats
 
 
 class PostModelTest(TestCase):
@@ -78,3 +81,39 @@ class GroupModelTest(TestCase):
         group = GroupModelTest.group
         group_str = str(group)
         self.assertEqual(group.title, group_str)
+
+
+class UserStatsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(text='Текст', author=self.author)
+        Comment.objects.create(text='Ком', author=self.reader, post=post)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        author_stats = self.stats(self.author)
+        reader_stats = self.stats(self.reader)
+        self.assertEqual(author_stats.posts, 1)
+        self.assertEqual(author_stats.followers, 1)
+        self.assertEqual(reader_stats.following, 1)
+        self.assertEqual(reader_stats.comments, 1)
+
+        follow.delete()
+        post.delete()
+        author_stats = self.stats(self.author)
+        self.assertEqual(author_stats.posts, 0)
+        self.assertEqual(author_stats.followers, 0)
+        self.assertEqual(self.stats(self.reader).following, 0)
+
+    def test_rebuild_command_reconciles_drift(self):
+        Post.objects.create(text='Текст', author=self.author)
+        UserStats.objects.filter(user=self.author).update(posts=42)
+        out = StringIO()
+        call_command('rebuild_user_stats', stdout=out)
+        self.assertEqual(self.stats(self.author).posts, 1)
+        self.assertEqual(self.stats(self.reader).posts, 0)
+        self.assertIn('создано 1, обновлено 1', out.getvalue())
@@ -0,0 +1,180 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from array import array
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import (Client, SimpleTestCase, TestCase,
+                         TransactionTestCase)
+from django.urls import reverse
+
+from posts.models import Follow, Recommendation, StaleRecommendation, User
+from posts.follow_graph import FollowGraph
+
+
+def graph(edges, **kwargs):
+    return FollowGraph(array('I', [user for user, _ in edges]),
+                       array('I', [author for _, author in edges]), **kwargs)
+
+
+class FollowGraphTest(SimpleTestCase):
+    def test_adjacency(self):
+        follows = graph([(1, 2), (1, 3), (4, 2)])
+        self.assertEqual(list(follows.following(1)), [2, 3])
+        self.assertEqual(list(follows.followers(2)), [1, 4])
+        self.assertEqual(list(follows.following(99)), [])
+        self.assertEqual(follows.sources(), [1, 4])
+        self.assertEqual(follows.edges, 3)
+
+    def test_friends_of_friends_rank_first_and_followed_excluded(self):
+        follows = graph([
+            (1, 2), (1, 3),
+            (2, 5), (3, 5), (2, 1), (2, 3),
+            (3, 6),
+        ])
+        recommended = [author for author, _ in follows.recommend(1, 10)]
+        self.assertEqual(recommended[:2], [5, 6])
+        self.assertNotIn(1, recommended)
+        self.assertNotIn(2, recommended)
+
+    def test_co_follow_similarity(self):
+        # 2 и 7 читают одни и те же люди, поэтому 7 предлагается тому,
+        # кто читает только 2
+        follows = graph([(10, 2), (10, 7), (11, 2), (11, 7), (1, 2)])
+        self.assertEqual(follows.recommend(1, 10)[0][0], 7)
+        self.assertEqual(
+            graph([(10, 2), (10, 7), (1, 2)],
+                  co_follow_weight=0).recommend(1, 10), [])
+
+    def test_neighbourhood_includes_followers(self):
+        follows = graph([(1, 2), (3, 1), (4, 1)])
+        self.assertEqual(follows.neighbourhood([1]), [1, 3, 4])
+
+    def test_neighbourhood_uses_followers_samples(self):
+        # 3 подписался на 1 первым, но 1 всё ещё среди его последних
+        # подписок; у 8 он из выборки уже вытеснен
+        follows = graph([(3, 1), (8, 1), (8, 5), (8, 6), (4, 1), (7, 1)],
+                        max_neighbors=2)
+        self.assertEqual(follows.neighbourhood([1]), [1, 3, 4, 7])
+
+
+class WebImportsTest(SimpleTestCase):
+    def test_web_workers_do_not_load_scipy(self):
+        # Отдельный процесс: в этом граф уже загружен тестами выше
+        script = (
+            'import sys, django; django.setup(); '
+            'import posts.views, posts.api, yatube.urls; '
+            "print(sorted({'posts.follow_graph', 'scipy'} "
+            '& set(sys.modules)))')
+        output = subprocess.run(
+            [sys.executable, '-c', script], check=True,
+            stdout=subprocess.PIPE, universal_newlines=True,
+            env={**os.environ,
+                 'DJANGO_SETTINGS_MODULE': 'yatube.settings'},
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__))))).stdout
+        self.assertEqual(output.strip(), '[]')
+
+
+class RecommendationsTest(TransactionTestCase):
+    # Отметки об удалённых подписках ставятся после коммита
+    def setUp(self):
+        cache.clear()
+        self.users = {name: User.objects.create_user(username=name)
+                      for name in ('anna', 'leo', 'max', 'kate', 'bob')}
+        for user, author in [('anna', 'leo'), ('leo', 'max'),
+                             ('leo', 'kate'), ('bob', 'kate')]:
+            Follow.objects.create(user=self.users[user],
+                                  author=self.users[author])
+
+    def rebuild(self, **options):
+        call_command('rebuild_recommendations', stdout=StringIO(), **options)
+
+    def recommended(self, name):
+        return list(self.users[name].recommendations.values_list(
+            'author__username', flat=True))
+
+    def test_rebuild_stores_top_k_and_clears_queue(self):
+        self.assertTrue(StaleRecommendation.objects.exists())
+        self.rebuild()
+        self.assertCountEqual(self.recommended('anna'), ['max', 'kate'])
+        self.assertFalse(StaleRecommendation.objects.exists())
+
+    def test_incremental_refresh_touches_only_changed_neighbourhood(self):
+        self.rebuild()
+        Recommendation.objects.filter(user=self.users['bob']).delete()
+        Follow.objects.filter(user=self.users['leo'],
+                              author=self.users['kate']).delete()
+        self.rebuild(incremental=True)
+        # anna читает leo и видит изменения его подписок, bob не затронут
+        self.assertEqual(self.recommended('anna'), ['max'])
+        self.assertEqual(self.recommended('bob'), [])
+        self.assertEqual(list(StaleRecommendation.objects.all()), [])
+
+    def test_follow_page_shows_recommendations(self):
+        self.rebuild()
+        client = Client()
+        client.force_login(self.users['anna'])
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [author.username for author in response.context['who_to_follow']],
+            self.recommended('anna'))
+        self.assertContains(response, 'Кого почитать')
+        Follow.objects.create(user=self.users['anna'],
+                              author=self.users['max'])
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [author.username for author in response.context['who_to_follow']],
+            ['kate'])
+
+    def test_deleting_follower_leaves_no_marker(self):
+        StaleRecommendation.objects.all().delete()
+        self.users['anna'].delete()
+        self.assertFalse(User.objects.filter(username='anna').exists())
+        self.assertFalse(StaleRecommendation.objects.exists())
+        Follow.objects.filter(user=self.users['bob']).delete()
+        self.assertEqual(
+            list(StaleRecommendation.objects.values_list(
+                'user__username', flat=True)), ['bob'])
+
+    def test_popular_authors_without_recommendations(self):
+        client = Client()
+        client.force_login(self.users['max'])
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [author.username for author in response.context['who_to_follow']],
+            ['kate', 'leo'])
+
+
+class BenchRecommendationsTest(TestCase):
+    def test_writes_json_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            call_command('bench_recommendations', users=200, sample=20,
+                         stale=5, output=path)
+            with open(path) as report_file:
+                report = json.load(report_file)
+        self.assertGreater(report['meta']['edges'], 0)
+        self.assertLessEqual(report['recommend_p50_ms'],
+                             report['recommend_p95_ms'])
+        self.assertGreaterEqual(report['incremental_users'], 5)
+
+    def test_database_mode_runs_real_rebuild(self):
+        users = [User.objects.create_user(username=f'user{i}')
+                 for i in range(4)]
+        Follow.objects.bulk_create(
+            [Follow(user=user, author=author)
+             for user in users for author in users if user != author])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            call_command('bench_recommendations', database=True, sample=2,
+                         stale=1, output=path)
+            with open(path) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(report['meta']['edges'], 12)
+        self.assertIn('full_rebuild_seconds', report)
+        self.assertFalse(StaleRecommendation.objects.exists())
@@ -0,0 +1,103 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import search
+from posts.models import Group, Post, User
+
+
+class SqliteFtsBackendTest(TestCase):
+    backend = 'posts.search.SqliteFtsBackend'
+
+    def setUp(self):
+        settings_override = override_settings(
+            POSTS_SEARCH_BACKEND=self.backend)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create_user(username='leo')
+        self.other = User.objects.create_user(username='anna')
+        self.group = Group.objects.create(
+            title='Коты', slug='cats', description='Про котов')
+        self.cats = Post.objects.create(
+            text='Коты бегают по крыше, кот за котом', author=self.author,
+            group=self.group)
+        self.dog = Post.objects.create(
+            text='Собака бегает по двору', author=self.other)
+        self.kitten = Post.objects.create(
+            text='Кот спит', author=self.other)
+
+    def find(self, query, **kwargs):
+        return search.get_backend().search(query, **kwargs)
+
+    def test_word_forms_are_matched(self):
+        self.assertEqual(set(self.find('котами')), {self.cats.pk,
+                                                    self.kitten.pk})
+        self.assertEqual(set(self.find('бегал')),
+                         {self.cats.pk, self.dog.pk})
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.find('кот собака'), [])
+        self.assertEqual(self.find('кот спит'), [self.kitten.pk])
+
+    def test_more_relevant_posts_come_first(self):
+        self.assertEqual(self.find('кот')[0], self.cats.pk)
+
+    def test_filters_by_author_and_group(self):
+        self.assertEqual(self.find('кот', author_id=self.other.pk),
+                         [self.kitten.pk])
+        self.assertEqual(self.find('кот', group_id=self.group.pk),
+                         [self.cats.pk])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.kitten.text = 'Попугай спит'
+        self.kitten.save()
+        self.assertEqual(self.find('попугай'), [self.kitten.pk])
+        self.assertEqual(self.find('кот'), [self.cats.pk])
+        self.cats.delete()
+        self.assertEqual(self.find('кот'), [])
+
+    def test_rebuild_command_restores_index(self):
+        search.get_backend().clear()
+        self.assertEqual(self.find('собака'), [])
+        call_command('rebuild_search_index', batch_size=2, stdout=StringIO())
+        self.assertEqual(self.find('собака'), [self.dog.pk])
+
+    def test_empty_query_finds_nothing(self):
+        self.assertEqual(self.find('!!!'), [])
+
+
+class InvertedIndexBackendTest(SqliteFtsBackendTest):
+    backend = 'posts.search.InvertedIndexBackend'
+
+
+class SearchViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='leo')
+        for number in range(12):
+            Post.objects.create(text=f'Кот номер {number}',
+                                author=self.author)
+        Post.objects.create(text='Собака', author=self.author)
+
+    def test_search_page_lists_matches(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'коты'})
+        page = response.context['page']
+        self.assertEqual(page.paginator.count, 12)
+        self.assertEqual(len(page.object_list), 10)
+        self.assertTrue(all('Кот' in post.text for post in page))
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82%D1%8B&page=2')
+
+    def test_unknown_author_is_a_form_error(self):
+        response = self.client.get(reverse('posts:search'),
+                                   {'q': 'кот', 'author': 'nobody'})
+        self.assertIsNone(response.context['page'])
+        self.assertTrue(response.context['form'].errors)
+
+    def test_empty_form_renders(self):
+        response = self.client.get(reverse('posts:search'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['page'])
@@ -1,11 +1,23 @@
 import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import skipUnless
+
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Group, Post, User, Follow
+from PIL import Image
+
+from posts import follows, renditions, thumbnails
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry,
+                          User)
 
 
 class PostPagesTests(TestCase):
@@ -171,6 +183,9 @@ class PaginatorViewsTest(TestCase):
                 author=cls.author,
                 group=cls.group)
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_contains_ten_records(self):
         paginators = [
             reverse('posts:index'),
@@ -189,3 +204,507 @@ class PaginatorViewsTest(TestCase):
             self.assertEqual(
                 len(response.context.get('page').object_list),
                 3)
+
+    def test_cursor_links_walk_the_feed(self):
+        response = self.client.get(reverse('posts:index'))
+        first_page = list(response.context['page'])
+        next_cursor = response.context['page'].paginator.next_cursor
+        self.assertIsNotNone(next_cursor)
+
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': next_cursor})
+        page = response.context['page']
+        self.assertEqual(len(page.object_list), 3)
+        self.assertEqual(page.number, 2)
+        self.assertFalse(page.has_next())
+        self.assertTrue(set(page).isdisjoint(first_page))
+
+        response = self.client.get(
+            reverse('posts:index'),
+            {'cursor': page.paginator.previous_cursor})
+        self.assertEqual(list(response.context['page']), first_page)
+        self.assertFalse(response.context['page'].has_previous())
+
+    def test_feed_does_not_count_posts(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:index'))
+        self.assertFalse(
+            any('COUNT(*)' in query['sql'] for query in queries))
+
+    def test_broken_cursor_opens_first_page(self):
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': 'broken!'})
+        self.assertEqual(response.context['page'].number, 1)
+        self.assertEqual(
+            len(response.context['page'].object_list), 10)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test-test',
+            description='Тестовое описание')
+        cls.author = User.objects.create_user(username='Poster')
+        cls.reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            post = Post.objects.create(
+                text=f'Пост {i}',
+                author=cls.author,
+                group=cls.group)
+            for j in range(2):
+                Comment.objects.create(
+                    text=f'Комментарий {j}',
+                    author=cls.reader,
+                    post=post)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(FeedQueriesTest.reader)
+
+    def test_feed_pages_run_constant_number_of_queries(self):
+        feeds = {
+            reverse('posts:index'): 1,
+            reverse('posts:hot'): 1,
+            reverse(
+                'posts:group',
+                kwargs={'slug': FeedQueriesTest.group.slug}): 2,
+            reverse(
+                'posts:profile',
+                kwargs={'username': FeedQueriesTest.author.username}): 2,
+        }
+        for url, queries in feeds.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.client.get(url)
+                with self.assertNumQueries(queries):
+                    self.client.get(url, {'page': 2})
+
+    def test_follow_feed_runs_constant_number_of_queries(self):
+        # Подписки и рекомендации зрителя после первого запроса берутся
+        # из кеша; остаются сессия, пользователь и сама лента.
+        self.reader_client.get(reverse('posts:follow_index'))
+        with self.assertNumQueries(3):
+            response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page'][0].comment_count, 2)
+
+
+@override_settings(COMMENTS_PER_PAGE=5)
+class PostCommentsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Poster')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        readers = [User.objects.create_user(username=f'reader{i}')
+                   for i in range(3)]
+        cls.comments = [
+            Comment.objects.create(text=f'Комментарий {i}',
+                                   author=readers[i % 3], post=cls.post)
+            for i in range(12)]
+
+    def setUp(self):
+        cache.clear()
+        self.post_url = reverse(
+            'posts:post', args=[self.author.username, self.post.pk])
+        self.comments_url = reverse(
+            'posts:post_comments', args=[self.author.username, self.post.pk])
+
+    def test_post_view_renders_first_chunk_in_constant_queries(self):
+        # Пост и первая порция комментариев вместе с авторами.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.post_url)
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.comments[:-6:-1])
+        self.assertContains(response, 'data-fragment="')
+
+    def test_fragment_continues_from_cursor(self):
+        first = self.client.get(self.post_url).context['comments']
+        # Проверка поста и порция комментариев с авторами
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                self.comments_url,
+                {'cursor': first.paginator.next_cursor})
+        self.assertEqual(list(response.context['comments']),
+                         self.comments[-6:-11:-1])
+        self.assertNotContains(response, '<form')
+
+    def test_json_chunks_cover_all_comments(self):
+        url = f'{self.comments_url}?format=json'
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [comment['id'] for comment in data['comments']]
+            url = data['next']
+        self.assertEqual(ids, [comment.pk for comment in self.comments[::-1]])
+        self.assertEqual(data['comments'][-1]['author'], 'reader0')
+
+    def test_unknown_or_mismatched_post_is_404(self):
+        for args in [(self.author.username, self.post.pk + 100),
+                     ('reader0', self.post.pk)]:
+            with self.subTest(args=args):
+                response = self.client.get(
+                    reverse('posts:post_comments', args=args),
+                    {'format': 'json'})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(FULL_PAGE_CACHE_TTL=0)
+class AnonymousConditionalTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.author = User.objects.create_user(username='Poster')
+        self.reader = User.objects.create_user(username='Reader')
+        self.post = Post.objects.create(text='Пост', author=self.author,
+                                        group=self.group)
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post', args=[self.author.username, self.post.pk]),
+        ]
+
+    def test_anonymous_pages_are_public_and_revalidated(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    response['Cache-Control'],
+                    'public, max-age=30, stale-while-revalidate=300')
+                cached = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(cached.status_code, 304)
+                self.assertEqual(cached.templates, [])
+                cached = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(cached.status_code, 304)
+
+    def test_not_modified_index_skips_rendering(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        # Только выборка страницы ленты.
+        with self.assertNumQueries(1):
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_comments_and_follows_change_validators(self):
+        post_url, profile_url = self.urls[3], self.urls[2]
+        post_etag = self.client.get(post_url)['ETag']
+        profile_etag = self.client.get(profile_url)['ETag']
+        Comment.objects.create(text='Новый', author=self.reader,
+                               post=self.post)
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(post_url, HTTP_IF_NONE_MATCH=post_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый')
+        response = self.client.get(profile_url,
+                                   HTTP_IF_NONE_MATCH=profile_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_authenticated_pages_are_private(self):
+        self.client.force_login(self.reader)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['Cache-Control'], 'private')
+                self.assertFalse(response.has_header('ETag'))
+
+
+@override_settings(FOLLOW_FEED_STRATEGY='write')
+class FanOutOnWriteTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Poster')
+        self.reader = User.objects.create_user(username='Reader')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.old_post = Post.objects.create(text='Старый', author=self.author)
+
+    def follow_page(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page'])
+
+    def test_follow_backfills_and_new_posts_are_pushed(self):
+        self.reader_client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': self.author.username}))
+        self.assertEqual(self.follow_page(), [self.old_post])
+        new_post = Post.objects.create(text='Новый', author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=new_post).exists())
+        self.assertEqual(self.follow_page(), [new_post, self.old_post])
+
+    def test_unfollow_prunes_timeline(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.author.username}))
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_page(), [])
+
+    @override_settings(FOLLOW_FEED_FAN_OUT_LIMIT=0)
+    def test_popular_authors_stay_on_read(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(text='Новый', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_page(), [new_post, self.old_post])
+
+    @override_settings(FOLLOW_FEED_FAN_OUT_LIMIT=1)
+    def test_posts_from_popular_period_survive_unfollows(self):
+        other = User.objects.create_user(username='Other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        popular_post = Post.objects.create(text='Популярный',
+                                           author=self.author)
+        Follow.objects.filter(user=other).delete()
+        self.assertEqual(self.follow_page(), [popular_post, self.old_post])
+        newest = Post.objects.create(text='Снова рассылается',
+                                     author=self.author)
+        # Пост и в ленте, и на выборке при чтении показывается один раз
+        self.assertEqual(self.follow_page(),
+                         [newest, popular_post, self.old_post])
+
+    @override_settings(FOLLOW_FEED_FAN_OUT_LIMIT=1, POSTS_PER_PAGE=2)
+    def test_cursor_merges_pushed_and_pulled_posts(self):
+        popular = User.objects.create_user(username='Popular')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=popular)
+        Follow.objects.create(user=self.author, author=popular)
+        posts = [Post.objects.create(text=f'Пост {i}',
+                                     author=(self.author, popular)[i % 2])
+                 for i in range(5)]
+        self.assertFalse(TimelineEntry.objects.filter(
+            post__author=popular).exists())
+        expected = [*posts[::-1], self.old_post]
+        url = reverse('posts:follow_index')
+        seen, cursors = [], []
+        response = self.reader_client.get(url)
+        while True:
+            page = response.context['page']
+            seen += list(page)
+            cursor = page.paginator.next_cursor
+            if cursor is None:
+                break
+            cursors.append(cursor)
+            response = self.reader_client.get(url, {'cursor': cursor})
+        self.assertEqual(seen, expected)
+        previous = response.context['page'].paginator.previous_cursor
+        response = self.reader_client.get(url, {'cursor': previous})
+        self.assertEqual(list(response.context['page']), expected[2:4])
+        response = self.reader_client.get(url, {'page': 2})
+        self.assertEqual(list(response.context['page']), expected[2:4])
+
+    @skipUnless(connection.vendor == 'sqlite', 'план запроса sqlite')
+    def test_timeline_page_reads_index_without_sort(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        plan = (TimelineEntry.objects.filter(user=self.reader)
+                .order_by('-pub_date', '-post_id')
+                .values_list('pub_date', 'post_id')[:11]).explain()
+        self.assertIn('timeline_user_feed_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class FollowedAuthorsCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Poster')
+        self.reader = User.objects.create_user(username='Reader')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.profile_url = reverse(
+            'posts:profile', kwargs={'username': self.author.username})
+
+    def follow_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.reader_client.get(self.profile_url)
+        return response, [query['sql'] for query in captured
+                          if 'posts_follow' in query['sql']]
+
+    def test_set_membership_and_serialization(self):
+        followed = follows.FollowedAuthors([7, 3, 42])
+        self.assertEqual(list(followed), [3, 7, 42])
+        restored = follows.FollowedAuthors.from_bytes(followed.to_bytes())
+        for author_id in (3, 7, 42):
+            self.assertIn(author_id, restored)
+        for author_id in (0, 4, 43):
+            self.assertNotIn(author_id, restored)
+
+    def test_profile_button_uses_cached_set(self):
+        response, queries = self.follow_queries()
+        self.assertContains(response, 'Подписаться')
+        self.assertEqual(len(queries), 1)
+        response, queries = self.follow_queries()
+        self.assertEqual(queries, [])
+
+    def test_follow_and_unfollow_invalidate_set(self):
+        self.follow_queries()
+        self.reader_client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': self.author.username}))
+        response, _ = self.follow_queries()
+        self.assertContains(response, 'Отписаться')
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.author.username}))
+        response, _ = self.follow_queries()
+        self.assertNotContains(response, 'Отписаться')
+        follows.follow(self.reader, [self.author.username])
+        response, _ = self.follow_queries()
+        self.assertContains(response, 'Отписаться')
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Poster')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.posts = [
+            Post.objects.create(text=f'Пост номер {i}', author=self.author)
+            for i in range(12)]
+
+    def index_html(self, **params):
+        return self.client.get(
+            reverse('posts:index'), params).content.decode()
+
+    def test_pages_are_cached_separately(self):
+        self.assertIn('Пост номер 11', self.index_html())
+        second_page = self.index_html(page=2)
+        self.assertIn('Пост номер 0', second_page)
+        self.assertNotIn('Пост номер 11', second_page)
+
+    def test_new_post_shows_up_at_once(self):
+        self.index_html()
+        Post.objects.create(text='Свежий пост', author=self.author)
+        self.assertIn('Свежий пост', self.index_html())
+
+    def test_edit_and_comment_invalidate_card(self):
+        self.index_html()
+        post = self.posts[-1]
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={
+                'username': self.author.username, 'post_id': post.id}),
+            {'text': 'Исправленный пост'})
+        self.author_client.post(
+            reverse('posts:add_comment', kwargs={
+                'username': self.author.username, 'post_id': post.id}),
+            {'text': 'Комментарий'})
+        html = self.index_html()
+        self.assertIn('Исправленный пост', html)
+        self.assertIn('Комментариев: 1', html)
+
+    def test_author_gets_own_card_variant(self):
+        self.index_html()
+        response = self.author_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Редактировать')
+        self.assertNotContains(self.client.get(reverse('posts:index')),
+                               'Редактировать')
+
+
+@override_settings(THUMBNAIL_ASYNC=False)
+class ThumbnailTest(TestCase):
+    small_gif = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Poster')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def upload(self):
+        return SimpleUploadedFile(
+            name='small.gif', content=self.small_gif,
+            content_type='image/gif')
+
+    def test_new_post_generates_thumbnail(self):
+        self.author_client.post(
+            reverse('posts:new_post'),
+            {'text': 'С картинкой', 'image': self.upload()})
+        post = Post.objects.get(text='С картинкой')
+        self.assertIsNotNone(thumbnails.ready_thumbnail(post.image))
+        self.assertContains(
+            self.client.get(reverse('posts:index')),
+            renditions.picture(post)['src'])
+
+    def test_missing_thumbnail_falls_back_to_original(self):
+        post = Post.objects.create(
+            text='Без миниатюры', author=self.author, image=self.upload())
+        with override_settings(THUMBNAIL_ASYNC=True):
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, post.image.url)
+
+    def test_warm_thumbnails_command(self):
+        post = Post.objects.create(
+            text='Старый пост', author=self.author, image=self.upload())
+        call_command('warm_thumbnails', workers=1, stdout=StringIO())
+        self.assertIsNotNone(thumbnails.ready_thumbnail(post.image))
+
+    def test_renditions_ladder_in_srcset(self):
+        file_obj = BytesIO()
+        Image.new('RGB', (1000, 400), 'blue').save(file_obj, 'PNG')
+        self.author_client.post(
+            reverse('posts:new_post'),
+            {'text': 'Широкая картинка',
+             'image': SimpleUploadedFile('wide.png', file_obj.getvalue(),
+                                         content_type='image/png')})
+        post = Post.objects.get(text='Широкая картинка')
+        ladder = renditions.parse(post.image_renditions)
+        self.assertEqual(
+            sorted({rendition['width'] for rendition in ladder}),
+            [320, 640, 960])
+        for rendition in ladder:
+            self.assertTrue(default_storage.exists(rendition['name']))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '640w')
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_replaced_image_drops_old_renditions(self):
+        self.author_client.post(
+            reverse('posts:new_post'),
+            {'text': 'Картинку заменят', 'image': self.upload()})
+        post = Post.objects.get(text='Картинку заменят')
+        edit_url = reverse('posts:post_edit',
+                           args=[self.author.username, post.pk])
+        old = renditions.parse(post.image_renditions)
+        self.assertTrue(old)
+        file_obj = BytesIO()
+        Image.new('RGB', (700, 300), 'red').save(file_obj, 'PNG')
+        self.author_client.post(edit_url, {
+            'text': post.text,
+            'image': SimpleUploadedFile('new.png', file_obj.getvalue(),
+                                        content_type='image/png')})
+        post.refresh_from_db()
+        new = renditions.parse(post.image_renditions)
+        self.assertTrue(new)
+        for rendition in old:
+            self.assertFalse(default_storage.exists(rendition['name']))
+        for rendition in new:
+            self.assertTrue(default_storage.exists(rendition['name']))
+        self.author_client.post(edit_url, {'text': post.text,
+                                           'image-clear': 'on'})
+        for rendition in new:
+            self.assertFalse(default_storage.exists(rendition['name']))
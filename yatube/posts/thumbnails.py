@@ -0,0 +1,105 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import caching, renditions
+
+logger = logging.getLogger(__name__)
+
+# Размеры, в которых карточки показывают картинку поста
+FEED_THUMBNAIL = ('960x339', {'crop': 'center', 'upscale': True})
+POST_THUMBNAILS = [FEED_THUMBNAIL]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class LookupBackend(ThumbnailBackend):
+    """Находит готовую миниатюру в key-value хранилище, не создавая её."""
+
+    def lookup(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+lookup_backend = LookupBackend()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    return _executor
+
+
+def ready_thumbnail(image, geometry=FEED_THUMBNAIL):
+    """Готовая миниатюра или None, если её ещё не создали."""
+    if not image:
+        return None
+    geometry_string, options = geometry
+    return lookup_backend.lookup(image.name, geometry_string, **options)
+
+
+def generate(post_id, name, stale_renditions=''):
+    """Создаёт миниатюры и лестницу размеров, сбрасывает кеш карточки.
+
+    Файлы stale_renditions — лестницы прежней картинки — удаляются,
+    когда новая уже записана в пост.
+    """
+    try:
+        for geometry_string, options in POST_THUMBNAILS:
+            get_thumbnail(name, geometry_string, **options)
+        renditions.build(post_id, name)
+        caching.bump(caching.post_card(post_id))
+        renditions.delete(stale_renditions)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+    finally:
+        cache.delete(_pending_key(name))
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def _pending_key(name):
+    return f'thumbnail-pending:{name}'
+
+
+def schedule(post, stale_renditions=''):
+    """Ставит создание миниатюр в фоновый пул после коммита транзакции.
+
+    Повторные вызовы для той же картинки, пока она в очереди,
+    игнорируются. При THUMBNAIL_ASYNC = False миниатюры создаются сразу.
+    stale_renditions — описание лестницы картинки, которую заменили.
+    """
+    name = post.image.name if post.image else None
+    if name and cache.add(_pending_key(name), True,
+                          settings.THUMBNAIL_PENDING_TTL):
+        task = (generate, post.pk, name, stale_renditions)
+    else:
+        # Новой лестницы не будет: старая больше нигде не нужна
+        task = (renditions.delete, stale_renditions)
+    if not settings.THUMBNAIL_ASYNC:
+        task[0](*task[1:])
+        return
+    transaction.on_commit(lambda: get_executor().submit(*task))
@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+FAN_OUT_ON_READ = 'read'
+FAN_OUT_ON_WRITE = 'write'
+
+
+def fan_out_on_write():
+    return settings.FOLLOW_FEED_STRATEGY == FAN_OUT_ON_WRITE
+
+
+def is_pushed(author_id):
+    """Рассылаются ли посты автора подписчикам при публикации.
+
+    Авторы, у которых подписчиков больше FOLLOW_FEED_FAN_OUT_LIMIT,
+    остаются на выборке при чтении, чтобы одна запись не порождала
+    миллионы строк.
+    """
+    followers = (UserStats.objects
+                 .filter(user_id=author_id)
+                 .values_list('followers', flat=True)
+                 .first()) or 0
+    return followers <= settings.FOLLOW_FEED_FAN_OUT_LIMIT
+
+
+def _pulled(prefix=''):
+    """Условие на UserStats авторов, чьи посты выбираются при чтении.
+
+    Это популярные сейчас авторы и те, чей пост однажды не разослался:
+    без второго условия такой пост пропал бы из лент, когда автор
+    снова опустится под лимит.
+    """
+    limit = settings.FOLLOW_FEED_FAN_OUT_LIMIT
+    return (Q(**{f'{prefix}followers__gt': limit})
+            | Q(**{f'{prefix}feed_pulled': True}))
+
+
+def follow_feed(user, posts=None):
+    """Посты авторов, на которых подписан пользователь.
+
+    При рассылке на запись страницы ленты выбирает posts_window().
+    """
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.filter(author__following__user=user)
+
+
+def _keyset(rows, id_field, after, before):
+    if after is not None:
+        key, pk = after
+        return rows.filter(
+            Q(pub_date__lt=key)
+            | Q(pub_date=key, **{f'{id_field}__lt': pk})
+        ).order_by('-pub_date', f'-{id_field}')
+    if before is not None:
+        key, pk = before
+        return rows.filter(
+            Q(pub_date__gt=key)
+            | Q(pub_date=key, **{f'{id_field}__gt': pk})
+        ).order_by('pub_date', id_field)
+    return rows.order_by('-pub_date', f'-{id_field}')
+
+
+def posts_window(user, limit, offset=0, after=None, before=None):
+    """id постов ленты подписок при рассылке на запись.
+
+    Окно ищется по ключу (pub_date, id) после after или до before —
+    тогда от старых к новым. Строки ленты и посты авторов на выборке
+    при чтении читаются отдельно, каждые не больше offset + limit, и
+    сливаются; пост, попавший в оба списка, берётся один раз.
+    """
+    count = offset + limit
+    pulled_authors = Follow.objects.filter(
+        _pulled('author__stats__'), user=user).values('author')
+    rows = [
+        *_keyset(TimelineEntry.objects.filter(user=user), 'post_id',
+                 after, before).values_list('pub_date', 'post_id')[:count],
+        *_keyset(Post.objects.filter(author__in=pulled_authors), 'id',
+                 after, before).values_list('pub_date', 'id')[:count],
+    ]
+    dates = dict((pk, pub_date) for pub_date, pk in rows)
+    ordered = sorted(dates, key=lambda pk: (dates[pk], pk),
+                     reverse=before is None)
+    return ordered[offset:count]
+
+
+def _push(user_ids, posts):
+    """Добавляет посты — пары (id, pub_date) — в ленты пользователей."""
+    entries = [TimelineEntry(user_id=user_id, post_id=post_id,
+                             pub_date=pub_date)
+               for user_id in user_ids for post_id, pub_date in posts]
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.FOLLOW_FEED_BATCH_SIZE,
+        ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты подписчиков автора."""
+    if not fan_out_on_write():
+        return
+    if not is_pushed(post.author_id):
+        UserStats.objects.filter(user_id=post.author_id,
+                                 feed_pulled=False).update(feed_pulled=True)
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    batch_size = settings.FOLLOW_FEED_BATCH_SIZE
+    posts = [(post.pk, post.pub_date)]
+    batch = []
+    for user_id in followers.iterator(chunk_size=batch_size):
+        batch.append(user_id)
+        if len(batch) == batch_size:
+            _push(batch, posts)
+            batch = []
+    _push(batch, posts)
+
+
+def backfill(follow):
+    """Заполняет ленту последними постами автора после подписки."""
+    backfill_authors(follow.user_id, [follow.author_id])
+
+
+def backfill_authors(user_id, author_ids):
+    """backfill() для подписки на нескольких авторов сразу."""
+    if not fan_out_on_write():
+        return
+    pulled = UserStats.objects.filter(
+        _pulled(), user_id__in=author_ids).values_list('user_id', flat=True)
+    pushed = set(author_ids).difference(pulled)
+    if pushed:
+        _push([user_id], _latest_posts(pushed, settings.FOLLOW_FEED_BACKFILL))
+
+
+def _latest_posts(author_ids, limit):
+    """(id, pub_date) последних limit постов каждого из авторов.
+
+    Читается одним запросом.
+    """
+    ranked = (Post.objects
+              .filter(author_id__in=author_ids)
+              .annotate(recent_rank=Window(
+                  RowNumber(),
+                  partition_by=[F('author_id')],
+                  order_by=[F('pub_date').desc(), F('id').desc()]))
+              .order_by()
+              .values('pk', 'pub_date', 'recent_rank'))
+    # Django 2.2 не фильтрует по оконным функциям: отбор по номеру
+    # делается во внешнем запросе
+    sql, params = ranked.query.sql_with_params()
+    latest = Post.objects.raw(
+        f'SELECT id, pub_date FROM ({sql}) ranked WHERE recent_rank <= %s',
+        [*params, limit])
+    return [(post.pk, post.pub_date) for post in latest]
+
+
+def prune(follow):
+    """Убирает из ленты посты автора после отписки."""
+    prune_authors(follow.user_id, [follow.author_id])
+
+
+def prune_authors(user_id, author_ids):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id__in=author_ids).delete()
@@ -5,11 +5,17 @@ from . import views
 app_name = "posts"
 urlpatterns = [
     path("group/<slug:slug>/", views.group_posts, name="group"),
+    path("tags/<str:name>/", views.tag_posts, name="tag"),
     path("new/", views.new_post, name="new_post"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("search/", views.search, name="search"),
+    path("hot/", views.hot, name="hot"),
     path("", views.index, name="index"),
     path("<str:username>/", views.profile, name='profile'),
     path("<str:username>/<int:post_id>/", views.post_view, name="post"),
+    path("<str:username>/<int:post_id>/comments/",
+         views.post_comments,
+         name="post_comments"),
     path("<str:username>/<int:post_id>/edit",
          views.post_edit,
          name="post_edit"),
@@ -1,25 +1,91 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from .models import Post, Group, User, Follow
-from .forms import PostForm, CommentForm
+from . import (caching, comment_writes, conditional, follows, markup,
+               recommendations, thumbnails)
+from .models import Comment, Post, Group, Tag, User
+from .feeds import feed_queryset
+from .forms import PostForm, CommentForm, SearchForm
+from .paginators import (paginate, paginate_comments, paginate_follow,
+                         paginate_hot)
+
+
+def _author_fingerprint(author):
+    """Счётчики из боковой панели автора, их нет в версиях кеша."""
+    stats = getattr(author, 'stats', None)
+    if stats is None:
+        return []
+    return [stats.followers, stats.following, stats.posts, stats.comments]
+
+
+def _feed_page(request, template, feed, page, context, extra=(),
+               dated=True):
+    """Страница ленты; анонимы получают 304 без рендера шаблона.
+
+    Без dated не отдаётся Last-Modified: в ленте не по дате первый пост
+    не самый свежий.
+    """
+    posts = page.object_list
+
+    def build(versions):
+        context['page'] = page
+        context['feed_cache_key'] = caching.feed_cache_key(
+            feed, page, request.user, versions)
+        return render(request, template, context)
+
+    return conditional.anonymous_page(
+        request, caching.feed_names(feed, posts), posts, build,
+        timestamps=[post.pub_date for post in posts[:1]],
+        extra=extra, dated=dated)
 
 
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, 'index.html', {'page': page})
+    post_list = feed_queryset()
+    page = paginate(request, post_list)
+    return _feed_page(request, 'index.html', caching.INDEX_FEED, page, {})
+
+
+def hot(request):
+    page = paginate_hot(request, feed_queryset())
+    return _feed_page(request, 'hot.html', caching.HOT_FEED, page, {},
+                      dated=False)
 
 
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, 'group.html', {'group': group, 'page': page})
+    posts = feed_queryset(group.posts.all())
+    page = paginate(request, posts)
+    return _feed_page(
+        request, 'group.html', caching.group_feed(group.pk), page,
+        {'group': group}, extra=[group.title, group.description])
+
+
+def tag_posts(request, name):
+    tag = get_object_or_404(Tag, name=name.lower())
+    page = paginate(request, feed_queryset(tag.posts.all()))
+    caching.prepare_cards(page.object_list, request.user)
+    return render(request, 'tag.html', {'tag': tag, 'page': page})
+
+
+def search(request):
+    form = SearchForm(request.GET or None)
+    page = None
+    if form.is_valid():
+        page = Paginator(form.search(), settings.POSTS_PER_PAGE).get_page(
+            request.GET.get('page'))
+        posts = feed_queryset().in_bulk(page.object_list)
+        # Порядок задаёт релевантность, а не дата публикации
+        page.object_list = [posts[post_id] for post_id in page.object_list
+                            if post_id in posts]
+        caching.prepare_cards(page.object_list, request.user)
+    params = request.GET.copy()
+    params.pop('page', None)
+    return render(
+        request,
+        'search.html',
+        {'form': form, 'page': page, 'query_string': params.urlencode()})
 
 
 @login_required
@@ -29,6 +95,7 @@ def new_post(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post)
         return redirect('posts:index')
     return render(
         request, 'processing_post.html',
@@ -36,25 +103,57 @@ def new_post(request):
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    following = (
-        request.user.is_authenticated
-        and Follow.objects.filter(user=request.user,
-                                  author__username=username).exists())
-    posts = author.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(
-        request,
-        'profile.html',
-        {'author': author, 'page': page, 'following': following})
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    posts = feed_queryset(author.posts.all())
+    page = paginate(request, posts)
+    return _feed_page(
+        request, 'profile.html', caching.profile_feed(author.pk), page,
+        {'author': author},
+        extra=_author_fingerprint(author))
 
 
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    form = CommentForm()
-    return render(request, 'post.html', {'post': post, 'form': form})
+    post = get_object_or_404(
+        feed_queryset().select_related('author__stats'), id=post_id)
+    comments = paginate_comments(request, post.comments.all())
+
+    def build(versions):
+        caching.prepare_cards([post], request.user, versions)
+        form = CommentForm()
+        return render(
+            request, 'post.html',
+            {'post': post, 'form': form, 'comments': comments})
+
+    return conditional.anonymous_page(
+        request, [caching.post_card(post.pk)], [post], build,
+        timestamps=[post.pub_date] + [
+            comment.created for comment in comments.object_list[:1]],
+        extra=_author_fingerprint(post.author))
+
+
+def post_comments(request, username, post_id):
+    """Следующая порция комментариев: HTML-фрагмент или ?format=json."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id,
+                             author__username=username)
+    comments = paginate_comments(
+        request, Comment.objects.filter(post=post))
+    if request.GET.get('format') != 'json':
+        return render(
+            request, 'template_blocks/comment_list.html',
+            {'comments': comments, 'username': username,
+             'post_id': post_id})
+    next_cursor = comments.paginator.next_cursor
+    return JsonResponse({
+        'comments': [{
+            'id': comment.pk,
+            'author': comment.author.username,
+            'created': comment.created.isoformat(),
+            'html': markup.body_html(comment),
+        } for comment in comments],
+        'next': next_cursor and (
+            f'{request.path}?format=json&cursor={next_cursor}'),
+    })
 
 
 def post_edit(request, username, post_id):
@@ -70,6 +169,8 @@ def post_edit(request, username, post_id):
             post_id=post_id)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post, form.stale_renditions)
         return redirect(
             'posts:post',
             username=post.author.username,
@@ -81,43 +182,47 @@ def post_edit(request, username, post_id):
 
 @login_required
 def add_comment(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
-        return redirect(
-            'posts:post',
-            username=username,
-            post_id=post_id)
+        key = (request.META.get('HTTP_IDEMPOTENCY_KEY')
+               or form.idempotency_key)
+        try:
+            comment_writes.write(comment, key)
+        except comment_writes.RateLimited as error:
+            response = HttpResponse(
+                'Слишком много комментариев, попробуйте позже',
+                status=429, content_type='text/plain; charset=utf-8')
+            response['Retry-After'] = error.retry_after
+            return response
     return redirect('posts:post', username=username, post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, 'follow.html', {'page': page})
+    page = paginate_follow(request, feed_queryset())
+    caching.prepare_cards(page.object_list, request.user)
+    who_to_follow = recommendations.who_to_follow(
+        request.user, follows.followed_authors(request.user),
+        settings.RECOMMENDATIONS_SHOWN)
+    return render(request, 'follow.html',
+                  {'page': page, 'who_to_follow': who_to_follow})
 
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if (not Follow.objects.filter(author=author, user=request.user).exists()
-            and request.user != author):
-        Follow.objects.create(author=author, user=request.user)
+    get_object_or_404(User.objects.only('pk'), username=username)
+    follows.follow(request.user, [username])
     return redirect('posts:profile', username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    get_object_or_404(Follow,
-                      author__username=username,
-                      user=request.user).delete()
+    if not follows.unfollow(request.user, [username]):
+        raise Http404
     return redirect('posts:profile', username)
 
 
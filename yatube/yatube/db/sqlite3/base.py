@@ -0,0 +1,29 @@
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """sqlite3 с настройкой соединений через OPTIONS.
+
+    pragmas — словарь PRAGMA, которые выполняются на каждом новом
+    соединении; transaction_mode — с какой блокировкой начинаются
+    транзакции atomic(). Остальные OPTIONS уходят в sqlite3.connect().
+    """
+
+    def get_new_connection(self, conn_params):
+        conn_params = dict(conn_params)
+        pragmas = conn_params.pop('pragmas', {})
+        conn_params.pop('transaction_mode', None)
+        conn = super().get_new_connection(conn_params)
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is None:
+            return super()._start_transaction_under_autocommit()
+        if mode.upper() not in TRANSACTION_MODES:
+            raise ValueError(f'Неизвестный режим транзакций: {mode}')
+        self.cursor().execute(f'BEGIN {mode}')
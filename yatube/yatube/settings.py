@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.middleware.RequestMetricsMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +60,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Замеры запросов: число и время SQL, рендер шаблонов, кеш, общее время
+REQUEST_METRICS = os.environ.get('REQUEST_METRICS') == '1'
+REQUEST_METRICS_QUERY_BUDGET = 20
+REQUEST_METRICS_TIME_BUDGET_MS = 300
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
@@ -69,6 +76,8 @@ TEMPLATES = [
         'OPTIONS': {
             'context_processors': [
                 'posts.context_processors.context_processors.year',
+                'posts.context_processors.context_processors.cache_ttl',
+                'posts.context_processors.context_processors.followed_authors',
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -84,21 +93,137 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# 'sqlite' для разработки и небольших установок, 'postgresql' — для
+# продакшена (нужен пакет psycopg2)
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+DATABASE_ENGINES = {
+    # sqlite3 с прагмами и режимом транзакций из OPTIONS
+    'sqlite': 'yatube.db.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+}
+DATABASE_NAMES = {
+    'sqlite': os.path.join(BASE_DIR, 'db.sqlite3'),
+    'postgresql': 'yatube',
+}
+DATABASE_OPTIONS = {
+    'sqlite': {
+        # Сколько секунд ждать, пока пишет другое соединение
+        'timeout': 20,
+        # Запись сразу берёт блокировку и ждёт timeout, а не падает
+        # с «database is locked» при повышении блокировки чтения
+        'transaction_mode': 'IMMEDIATE',
+        # Выполняются на каждом новом соединении. WAL не даёт читателям
+        # и писателю блокировать друг друга; при NORMAL fsync делается
+        # только на контрольных точках
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+            'cache_size': -32 * 1024,
+        },
+    },
+    'postgresql': {
+        'connect_timeout': 5,
+    },
+}
+# Отдельный PgBouncer в режиме transaction держит пул соединений между
+# всеми процессами; серверные курсоры через него не работают
+DATABASE_POOLER = os.environ.get('DATABASE_POOLER') == 'pgbouncer'
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': DATABASE_ENGINES[DATABASE_ENGINE],
+        'NAME': os.environ.get('DATABASE_NAME',
+                               DATABASE_NAMES[DATABASE_ENGINE]),
+        'USER': os.environ.get('DATABASE_USER', ''),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        'HOST': os.environ.get('DATABASE_HOST', ''),
+        'PORT': os.environ.get('DATABASE_PORT', ''),
+        # Соединение переживает запрос и переиспользуется потоком
+        # воркера столько секунд; 0 — новое соединение на каждый запрос
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'DISABLE_SERVER_SIDE_CURSORS': DATABASE_POOLER,
+        'OPTIONS': DATABASE_OPTIONS[DATABASE_ENGINE],
     }
 }
 
 # Cashes
 
+# Кеш, общий для всех процессов: 'file', 'memcached' или 'redis'.
+# 'locmem' у каждого процесса свой и годится только для разработки.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+    'redis': 'django_redis.cache.RedisCache',
+}
+CACHE_LOCATIONS = {
+    'locmem': '',
+    'file': os.path.join(BASE_DIR, 'cache'),
+    'memcached': '127.0.0.1:11211',
+    'redis': 'redis://127.0.0.1:6379/0',
+}
+CACHE_OPTIONS = {
+    'redis': {
+        # Соединений в пуле на процесс
+        'CONNECTION_POOL_KWARGS': {
+            'max_connections': int(
+                os.environ.get('CACHE_MAX_CONNECTIONS', 10)),
+        },
+        'SOCKET_CONNECT_TIMEOUT': 1,
+        'SOCKET_TIMEOUT': 1,
+        # Фрагменты страниц хранятся сжатыми
+        'COMPRESSOR': 'django_redis.compressors.zlib.ZlibCompressor',
+        # Недоступный Redis — промах кеша, а не ошибка 500: чтение
+        # возвращает None, запись пропускается, add и incr — None
+        'IGNORE_EXCEPTIONS': True,
+    },
+}
+DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CACHE_LOCATION',
+                                   CACHE_LOCATIONS[CACHE_BACKEND]),
+        # Префикс разделяет несколько проектов в одном сервере кеша
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'yatube'),
+        'OPTIONS': CACHE_OPTIONS.get(CACHE_BACKEND, {}),
     }
 }
 
+# Фрагменты лент и карточек постов версионируются и сбрасываются при
+# записи, поэтому их можно держать долго
+FEED_CACHE_TTL = 60 * 60 * 6
+CACHE_VERSION_TTL = 60 * 60 * 24 * 7
+
+# Cache-Control для страниц лент у анонимов: сколько секунд копия
+# свежая и сколько ещё её можно отдавать, обновляя в фоне
+ANONYMOUS_CACHE_MAX_AGE = 30
+ANONYMOUS_CACHE_STALE = 300
+# Полностраничный кеш лент для запросов без сессии, 0 — выключен.
+# Новые, изменённые и удалённые посты сбрасывают его сразу, а счётчики
+# комментариев и подписчиков обновляются не позже чем через TTL
+FULL_PAGE_CACHE_TTL = 60
+
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'posts.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -142,6 +267,93 @@ STATICFILES_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загруженные картинки уменьшаются до POST_IMAGE_MAX_SIZE по большей
+# стороне и перекодируются без EXIF в 'JPEG' (прогрессивный) или 'WEBP'
+POST_IMAGE_MAX_SIZE = 2048
+POST_IMAGE_FORMAT = 'JPEG'
+POST_IMAGE_QUALITY = 85
+
+# Лестница размеров картинки для srcset карточек ленты; форматы,
+# которых нет в сборке Pillow (например, 'AVIF'), пропускаются
+POST_RENDITION_WIDTHS = [320, 640, 960, 1440]
+POST_RENDITION_FORMATS = ['WEBP', 'JPEG']
+POST_RENDITION_ASPECT = (960, 339)
+POST_RENDITION_SIZES = '(max-width: 767px) 100vw, 730px'
+
+# Миниатюры создаются фоновым пулом потоков после сохранения поста
+THUMBNAIL_ASYNC = True
+THUMBNAIL_WORKERS = 2
+# Сколько секунд картинка считается стоящей в очереди
+THUMBNAIL_PENDING_TTL = 60
+
+# Posts feeds
+
+POSTS_PER_PAGE = 10
+# Сколько первых страниц по старым ссылкам ?page=N ещё обслуживается
+POSTS_LEGACY_PAGES = 5
+# Комментарии под постом подгружаются порциями
+COMMENTS_PER_PAGE = 20
+
+# Запись комментариев: 'sync' — каждый в своей транзакции, 'batch' —
+# фоновый поток процесса пишет их пачками через bulk_create
+COMMENT_WRITE_MODE = os.environ.get('COMMENT_WRITE_MODE', 'sync')
+COMMENT_BATCH_SIZE = 50
+# Сколько секунд поток ждёт, пока пачка наберётся
+COMMENT_BATCH_LINGER = 0.005
+# При полной очереди комментарии пишутся синхронно
+COMMENT_BATCH_QUEUE = 1000
+COMMENT_BATCH_TIMEOUT = 5
+# Не больше COMMENT_RATE_LIMIT комментариев от пользователя за
+# COMMENT_RATE_PERIOD секунд; 0 — без ограничения
+COMMENT_RATE_LIMIT = 10
+COMMENT_RATE_PERIOD = 60
+# Сколько секунд повторная отправка формы с тем же ключом игнорируется
+COMMENT_IDEMPOTENCY_TTL = 600
+
+# Лента «Популярное»: вес публикации и каждого комментария вдвое
+# затухает за HOT_FEED_HALF_LIFE часов. Оценки копятся на запись,
+# rebuild_hot_scores периодически пересчитывает их начисто
+HOT_FEED_HALF_LIFE = 12
+HOT_FEED_POST_WEIGHT = 2.0
+HOT_FEED_COMMENT_WEIGHT = 1.0
+
+# Лента подписок: 'read' — выборка через Follow на каждый запрос,
+# 'write' — id новых постов рассылаются подписчикам при публикации
+FOLLOW_FEED_STRATEGY = os.environ.get('FOLLOW_FEED_STRATEGY', 'read')
+# Авторы с большим числом подписчиков остаются на 'read'; не разосланные
+# посты выбираются при чтении и после того, как подписчиков стало
+# меньше, пока rebuild_timelines не разошлёт их
+FOLLOW_FEED_FAN_OUT_LIMIT = 10000
+# Сколько последних постов автора попадает в ленту при подписке
+FOLLOW_FEED_BACKFILL = 1000
+FOLLOW_FEED_BATCH_SIZE = 1000
+# Сколько имён можно подписать и отписать одним запросом к API
+FOLLOW_BATCH_LIMIT = 100
+# id авторов, на которых подписан пользователь, держатся в кеше и
+# сбрасываются при подписке и отписке
+FOLLOWED_AUTHORS_CACHE_TTL = 60 * 60 * 24
+
+# «Кого почитать»: рекомендации считает rebuild_recommendations.
+# Сколько авторов хранится на пользователя и показывается в ленте
+RECOMMENDATIONS_TOP_K = 20
+RECOMMENDATIONS_SHOWN = 5
+# У популярных вершин графа берутся только столько последних соседей
+RECOMMENDATIONS_MAX_NEIGHBORS = 50
+# Сколько похожих по совместным подпискам авторов помнится на автора
+RECOMMENDATIONS_SIMILAR_AUTHORS = 20
+# Вес близости по совместным подпискам относительно друзей друзей
+RECOMMENDATIONS_CO_FOLLOW_WEIGHT = 1.0
+
+# Posts search
+
+# Путь к классу бэкенда поиска; пусто — FTS5 на SQLite, иначе
+# инвертированный индекс в таблице posts_searchterm
+POSTS_SEARCH_BACKEND = os.environ.get('POSTS_SEARCH_BACKEND', '')
+# Язык стеммера Snowball для слов постов и запросов
+POSTS_SEARCH_LANGUAGE = 'russian'
+POSTS_SEARCH_MAX_RESULTS = 1000
+POSTS_SEARCH_BATCH_SIZE = 1000
+
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "posts:index"
 LOGOUT_REDIRECT_URL = "posts:index"
@@ -13,6 +13,7 @@ urlpatterns = [
     path("auth/", include("django.contrib.auth.urls")),
     path("about/", include("about.urls")),
     path("admin/", admin.site.urls),
+    path("api/v1/", include("posts.api_urls")),
     path("", include("posts.urls")),
 ]
 